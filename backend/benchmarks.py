@@ -0,0 +1,137 @@
+"""Micro-benchmarks for hot paths in server.py.
+
+Run from the backend directory with the same .env the server uses:
+
+    python benchmarks.py            # every benchmark
+    python benchmarks.py bot_filter # just one
+"""
+import asyncio
+import random
+import sys
+import timeit
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import server
+
+SAMPLE_USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_4) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:125.0) Gecko/20100101 Firefox/125.0",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+    "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)",
+    "Mozilla/5.0 (compatible; UptimeRobot/2.0; http://www.uptimerobot.com/)",
+    "Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)",
+    "curl/8.5.0",
+    "python-requests/2.31.0",
+]
+
+def report(name: str, seconds: float, iterations: int):
+    print(f"{name:<40} {seconds / iterations * 1e9:>10.0f} ns/op  ({iterations} ops)")
+
+def bench_bot_filter(iterations: int = 200000):
+    """Cost of classifying one tracking hit, cold (regex) and warm (LRU cache)"""
+    classify = server.is_bot_user_agent.__wrapped__
+    agents = [random.choice(SAMPLE_USER_AGENTS) for _ in range(iterations)]
+
+    seconds = timeit.timeit(lambda: [classify(agent) for agent in agents], number=1)
+    report("bot_filter: regex only", seconds, iterations)
+
+    # Unique strings defeat the cache, like a long tail of browser versions
+    unique = [f"{agent} build/{i}" for i, agent in enumerate(agents)]
+    server.is_bot_user_agent.cache_clear()
+    seconds = timeit.timeit(lambda: [server.is_bot_user_agent(agent) for agent in unique], number=1)
+    report("bot_filter: cache misses", seconds, iterations)
+
+    server.is_bot_user_agent.cache_clear()
+    seconds = timeit.timeit(lambda: [server.is_bot_user_agent(agent) for agent in agents], number=1)
+    report("bot_filter: cache hits", seconds, iterations)
+    print(f"  verdict cache: {server.is_bot_user_agent.cache_info()}")
+
+def bench_quotes(iterations: int = 200):
+    """Comparison-table quotes: one calculate_package_price call per cell vs one batch"""
+    server.rebuild_pricing_tables()
+    pairs = [
+        server.QuoteRequest(package_id=package_id, pages=pages)
+        for package_id, package in server.PACKAGES.items()
+        for pages in range(1, package.get("max_pages", 10) + 1)
+    ]
+
+    def per_call():
+        # What the quote page does today: one request, one calculation, one JSON encode per cell
+        return [server.prebuilt_json(server.calculate_package_price(pair.package_id, pair.pages))["body"] for pair in pairs]
+
+    seconds = timeit.timeit(per_call, number=iterations)
+    report(f"quotes: per-call x{len(pairs)}", seconds, iterations)
+    seconds = timeit.timeit(lambda: server.batch_quote_body(pairs), number=iterations)
+    report(f"quotes: batch of {len(pairs)}", seconds, iterations)
+
+def bench_cheapest(iterations: int = 20000):
+    """Cheapest package for N pages: loop over calculate_package_price vs one numpy pass"""
+    server.rebuild_pricing_tables()
+
+    def loop(pages):
+        ranked = []
+        for package_id, package in server.PACKAGES.items():
+            if server.is_flat_rate_package(package):
+                continue
+            try:
+                ranked.append((package_id, server.calculate_package_price(package_id, pages)["final_price"]))
+            except server.HTTPException:
+                pass
+        return sorted(ranked, key=lambda item: item[1])
+
+    page_counts = [random.randint(0, 50) for _ in range(iterations)]
+    assert all(loop(pages) == server.rank_packages_for_pages(pages) for pages in range(0, 51))
+    seconds = timeit.timeit(lambda: [loop(pages) for pages in page_counts], number=1)
+    report("cheapest: per-package loop", seconds, iterations)
+    seconds = timeit.timeit(lambda: [server.rank_packages_for_pages(pages) for pages in page_counts], number=1)
+    report("cheapest: vectorized", seconds, iterations)
+
+def sample_documents(model, samples: List[dict], count: int) -> List[dict]:
+    """Documents shaped like what Mongo returns for `model` (validated once, as on insert)"""
+    return [model(**{**random.choice(samples), "slug": f"post-{i}"}).dict() for i in range(count)]
+
+def bench_reads(iterations: int = 500):
+    """Read endpoints: models + response_model validation + stdlib JSON vs trusted dicts + orjson"""
+    loop = asyncio.new_event_loop()
+    cases = [
+        ("GET /blog", server.BlogPost, sample_documents(server.BlogPost, server.SAMPLE_BLOG_POSTS, 10)),
+        ("GET /social/posts", server.SocialMediaPost, sample_documents(server.SocialMediaPost, server.SAMPLE_SOCIAL_POSTS, 6)),
+        ("GET /affiliate", server.AffiliateLink, [
+            server.AffiliateLink(partner_name=f"Partner {i}", link=f"https://example.com/{i}").dict() for i in range(100)
+        ]),
+    ]
+    for name, model, docs in cases:
+        field = create_response_field(name="Response", type_=List[model])
+
+        async def before():
+            # Previous path: model per document, response_model validation, jsonable_encoder + json.dumps
+            content = await serialize_response(field=field, response_content=[model(**doc) for doc in docs], is_coroutine=True)
+            return JSONResponse(content=content).body
+
+        def after():
+            return server.trusted_json_response(server.fill_model_defaults(model, docs)).body
+
+        seconds = timeit.timeit(lambda: loop.run_until_complete(before()), number=iterations)
+        report(f"{name}: validated ({len(docs)} docs)", seconds, iterations)
+        seconds = timeit.timeit(after, number=iterations)
+        report(f"{name}: trusted{' + orjson' if server.orjson else ''}", seconds, iterations)
+    loop.close()
+
+BENCHMARKS = {
+    "bot_filter": bench_bot_filter,
+    "quotes": bench_quotes,
+    "cheapest": bench_cheapest,
+    "reads": bench_reads,
+}
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
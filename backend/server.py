@@ -1,15 +1,23 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, BackgroundTasks, Depends, Header
-from fastapi.responses import Response
+from fastapi import FastAPI, APIRouter, HTTPException, Request, BackgroundTasks, Depends, Header, Query
+from fastapi.responses import Response, StreamingResponse, JSONResponse, ORJSONResponse
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson import Binary, encode as bson_encode, decode as bson_decode
+from bson.codec_options import CodecOptions
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne, ReturnDocument
+from pymongo.errors import OperationFailure, BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, ValidationError
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
+from email.utils import format_datetime, parsedate_to_datetime
+from xml.sax.saxutils import escape as xml_escape
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 from paypalcheckoutsdk.core import SandboxEnvironment, LiveEnvironment, PayPalHttpClient
@@ -21,6 +29,30 @@ import re
 import json
 import secrets
 import hashlib
+import time
+import math
+from collections import deque, OrderedDict
+from functools import lru_cache
+import asyncio
+import numpy as np
+import base64
+import csv
+import gzip
+import zlib
+import io
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Optional: only needed with CACHE_BACKEND=redis
+    redis_asyncio = None
+try:
+    import brotli
+except ImportError:  # Optional: responses fall back to gzip
+    brotli = None
+try:
+    import orjson
+except ImportError:  # Optional: JSON falls back to the stdlib encoder
+    orjson = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -34,11 +66,26 @@ logging.info(f"Admin API Key set. Use this key for admin endpoints.")
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware so stored BSON dates come back as UTC-aware datetimes
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
+# Multi-document transactions need a replica set or sharded cluster;
+# detected on startup by detect_transaction_support()
+mongo_supports_transactions = False
+
+async def detect_transaction_support():
+    """Check whether the connected deployment can run transactions"""
+    global mongo_supports_transactions
+    try:
+        hello = await client.admin.command("hello")
+        mongo_supports_transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+    except Exception as e:
+        logging.error(f"Transaction support check failed: {str(e)}")
+        mongo_supports_transactions = False
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse if orjson is not None else JSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -229,6 +276,15 @@ class LeadUpdate(BaseModel):
     booking_scheduled: Optional[bool] = None
     booking_datetime: Optional[datetime] = None
 
+class LeadBulkFilter(BaseModel):
+    status: Optional[str] = None
+    source: Optional[str] = None
+
+class LeadBulkUpdate(BaseModel):
+    lead_ids: Optional[List[str]] = None
+    filter: Optional[LeadBulkFilter] = None
+    update: LeadUpdate
+
 class LeadActivity(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     lead_id: str
@@ -527,7 +583,6 @@ async def initialize_blog_posts():
                 )
                 
                 post_dict = blog_post.dict()
-                post_dict['timestamp'] = post_dict['timestamp'].isoformat()
                 await db.blog_posts.insert_one(post_dict)
             
             logging.info("Sample blog posts initialized")
@@ -543,7 +598,6 @@ async def initialize_social_posts():
                 social_post = SocialMediaPost(**post_data)
                 
                 post_dict = social_post.dict()
-                post_dict['timestamp'] = post_dict['timestamp'].isoformat()
                 await db.social_media_posts.insert_one(post_dict)
             
             logging.info("Sample social media posts initialized")
@@ -589,13 +643,263 @@ async def initialize_lead_magnets():
             for magnet_data in lead_magnets:
                 magnet = LeadMagnet(**magnet_data)
                 magnet_dict = magnet.dict()
-                magnet_dict['timestamp'] = magnet_dict['timestamp'].isoformat()
                 await db.lead_magnets.insert_one(magnet_dict)
             
             logging.info("Sample lead magnets initialized")
     except Exception as e:
         logging.error(f"Failed to initialize lead magnets: {str(e)}")
 
+# ============ HTTP CONDITIONAL RESPONSES ============
+
+# Process start; static content generated from code only changes on deploy
+APP_STARTED_AT = datetime.now(timezone.utc).replace(microsecond=0)
+
+CACHE_CONTROL_CONTENT = "public, max-age=300"
+CACHE_CONTROL_STATIC = "public, max-age=3600"
+
+# CompressionMiddleware tags encoded representations as "<etag>-gzip" / "<etag>-br"
+ETAG_ENCODING_SUFFIXES = ('-gzip"', '-br"')
+
+def normalize_etag(tag: str) -> str:
+    """Strip the weak prefix and any content-coding suffix from an entity tag"""
+    tag = tag.strip().removeprefix("W/")
+    for suffix in ETAG_ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our ETag (RFC 9110 13.1.2)"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = normalize_etag(etag)
+    return any(normalize_etag(candidate) == opaque for candidate in if_none_match.split(","))
+
+def json_bytes(payload: Any) -> bytes:
+    """Serialize a response payload, with orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload)
+        except TypeError:
+            # Types orjson doesn't know (models, ObjectIds, sets) go through FastAPI's encoder
+            return orjson.dumps(jsonable_encoder(payload))
+    return JSONResponse(content=jsonable_encoder(payload)).body
+
+def trusted_json_response(payload: Any) -> Response:
+    """Send documents we wrote ourselves without a response_model validation pass"""
+    return Response(content=json_bytes(payload), media_type="application/json")
+
+def model_projection(model) -> Dict:
+    """Mongo projection of exactly a model's fields, without _id"""
+    return {"_id": 0, **{field: 1 for field in model.__fields__}}
+
+def fill_model_defaults(model, docs: List[Dict]) -> List[Dict]:
+    """Add a model's static defaults to trusted documents that predate a field, without validating"""
+    defaults = {
+        name: field.default for name, field in model.__fields__.items()
+        if not field.is_required() and field.default_factory is None
+    }
+    return [{**defaults, **doc} for doc in docs]
+
+def content_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    """Whether an Accept-Encoding header lists `encoding` without q=0"""
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip() == encoding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+def conditional_response(request: Request, content: Any, media_type: str = "application/json",
+                         last_modified: Optional[datetime] = None, cache_control: str = CACHE_CONTROL_CONTENT,
+                         etag: Optional[str] = None, extra_headers: Optional[Dict[str, str]] = None) -> Response:
+    """Build a response with a strong content ETag, answering 304 when the client's copy is current.
+    
+    `content` is bytes/str sent as-is, or anything JSON-encodable. Pass `etag`
+    when it was computed ahead of time. If-None-Match takes precedence over
+    If-Modified-Since, which is only honored when a Last-Modified is known.
+    """
+    if isinstance(content, (bytes, str)):
+        body = content.encode() if isinstance(content, str) else content
+    else:
+        body = json_bytes(content)
+    
+    headers = {
+        "ETag": etag or content_etag(body),
+        "Cache-Control": cache_control,
+        **(extra_headers or {})
+    }
+    if last_modified is not None:
+        last_modified = as_utc(last_modified).replace(microsecond=0)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, headers["ETag"])
+    elif if_modified_since and last_modified is not None:
+        try:
+            not_modified = last_modified <= as_utc(parsedate_to_datetime(if_modified_since))
+        except (TypeError, ValueError):
+            not_modified = False
+    else:
+        not_modified = False
+    
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+# ============ SITEMAPS ============
+
+# Protocol limit per sitemap file; past it /seo/sitemap.xml becomes a sitemap index
+SITEMAP_MAX_URLS = 50000
+
+STATIC_SITEMAP_PAGES = [
+    {"path": "/", "priority": "1.0", "changefreq": "weekly"},
+    {"path": "/services", "priority": "0.9", "changefreq": "weekly"},
+    {"path": "/get-quote", "priority": "0.9", "changefreq": "monthly"},
+    {"path": "/proof", "priority": "0.8", "changefreq": "weekly"},
+    {"path": "/tools", "priority": "0.8", "changefreq": "monthly"},
+    {"path": "/about", "priority": "0.7", "changefreq": "monthly"},
+    {"path": "/contact", "priority": "0.7", "changefreq": "monthly"},
+    {"path": "/blog", "priority": "0.7", "changefreq": "daily"},
+    {"path": "/newreach-transport", "priority": "0.6", "changefreq": "monthly"},
+    {"path": "/privacy", "priority": "0.3", "changefreq": "yearly"},
+]
+
+# Core pages listed ahead of blog posts in the extended sitemap
+EXTENDED_SITEMAP_PAGES = [
+    {"loc": BASE_URL, "priority": "1.0", "changefreq": "weekly"},
+    {"loc": f"{BASE_URL}/services", "priority": "0.9", "changefreq": "monthly"},
+    {"loc": f"{BASE_URL}/proof", "priority": "0.8", "changefreq": "monthly"},
+    {"loc": f"{BASE_URL}/blog", "priority": "0.8", "changefreq": "weekly"},
+    {"loc": f"{BASE_URL}/contact", "priority": "0.7", "changefreq": "monthly"},
+]
+EXTENDED_SITEMAP_LASTMOD = datetime(2025, 1, 3, tzinfo=timezone.utc)
+
+# Built documents by name: "main", "extended", and "extended-N" shards
+# `version` is the shared "sitemaps" cache namespace version they were built at,
+# so a post created on any worker triggers a rebuild on every worker
+sitemap_state = {"documents": {}, "built_at": None, "url_count": 0, "version": None}
+sitemap_lock = asyncio.Lock()
+
+def sitemap_url(loc: str, lastmod: datetime, changefreq: str, priority: str, indent: str = "    ") -> str:
+    return (
+        f"{indent}<url>\n"
+        f"{indent}    <loc>{xml_escape(loc)}</loc>\n"
+        f"{indent}    <lastmod>{lastmod.strftime('%Y-%m-%d')}</lastmod>\n"
+        f"{indent}    <changefreq>{changefreq}</changefreq>\n"
+        f"{indent}    <priority>{priority}</priority>\n"
+        f"{indent}</url>\n"
+    )
+
+def urlset_xml(urls: List[str]) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        + "".join(urls)
+        + "</urlset>"
+    )
+
+def sitemap_document(xml: str, last_modified: datetime) -> Dict:
+    """Encode a sitemap once, with gzip bytes and ETags for both representations"""
+    identity = xml.encode()
+    compressed = gzip.compress(identity, compresslevel=9, mtime=0)
+    return {
+        "identity": identity,
+        "gzip": compressed,
+        "etag": {"identity": content_etag(identity), "gzip": content_etag(compressed)},
+        "last_modified": last_modified
+    }
+
+async def rebuild_sitemaps():
+    """Render every sitemap from a slug/timestamp projection of published posts"""
+    now = datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    documents = {
+        "main": sitemap_document(urlset_xml([
+            sitemap_url(f"{BASE_URL}{page['path']}", today, page["changefreq"], page["priority"], indent="  ")
+            for page in STATIC_SITEMAP_PAGES
+        ]), today)
+    }
+    
+    entries = [(page["loc"], EXTENDED_SITEMAP_LASTMOD, page["changefreq"], page["priority"]) for page in EXTENDED_SITEMAP_PAGES]
+    async for post in db.blog_posts.find({"published": True}, {"_id": 0, "slug": 1, "timestamp": 1}).sort("timestamp", ASCENDING):
+        if post.get("slug"):
+            lastmod = post["timestamp"] if isinstance(post.get("timestamp"), datetime) else EXTENDED_SITEMAP_LASTMOD
+            entries.append((f"{BASE_URL}/blog/{post['slug']}", lastmod, "monthly", "0.6"))
+    
+    if len(entries) <= SITEMAP_MAX_URLS:
+        documents["extended"] = sitemap_document(
+            urlset_xml([sitemap_url(*entry) for entry in entries]),
+            max(entry[1] for entry in entries)
+        )
+    else:
+        index = []
+        for page, start in enumerate(range(0, len(entries), SITEMAP_MAX_URLS), start=1):
+            shard = entries[start:start + SITEMAP_MAX_URLS]
+            last_modified = max(entry[1] for entry in shard)
+            documents[f"extended-{page}"] = sitemap_document(urlset_xml([sitemap_url(*entry) for entry in shard]), last_modified)
+            index.append(
+                f"    <sitemap>\n"
+                f"        <loc>{xml_escape(f'{BASE_URL}/api/seo/sitemap-{page}.xml')}</loc>\n"
+                f"        <lastmod>{last_modified.strftime('%Y-%m-%d')}</lastmod>\n"
+                f"    </sitemap>\n"
+            )
+        documents["extended"] = sitemap_document(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            + "".join(index)
+            + "</sitemapindex>",
+            max(entry[1] for entry in entries)
+        )
+    
+    sitemap_state.update({"documents": documents, "built_at": now, "url_count": len(entries)})
+
+async def invalidate_sitemaps():
+    await content_cache.invalidate("sitemaps")
+
+def sitemaps_stale(version: Optional[int]) -> bool:
+    built_at = sitemap_state["built_at"]
+    return built_at is None or version != sitemap_state["version"] or built_at.date() != datetime.now(timezone.utc).date()
+
+async def get_sitemap_document(name: str) -> Optional[Dict]:
+    """Return a built sitemap, rebuilding first if posts changed or the day rolled over"""
+    try:
+        version = await content_cache.namespace_version("sitemaps")
+    except Exception as e:
+        logging.error(f"Sitemap version check error: {str(e)}")
+        version = sitemap_state["version"]
+    if sitemaps_stale(version):
+        async with sitemap_lock:
+            # Another request may have rebuilt while we waited
+            if sitemaps_stale(version):
+                try:
+                    await rebuild_sitemaps()
+                    sitemap_state["version"] = version
+                except Exception as e:
+                    logging.error(f"Sitemap rebuild error: {str(e)}")
+                    if sitemap_state["built_at"] is None:
+                        raise
+    return sitemap_state["documents"].get(name)
+
+async def sitemap_response(request: Request, name: str) -> Response:
+    """Serve a prebuilt sitemap, gzipped from memory when the client accepts it"""
+    document = await get_sitemap_document(name)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Sitemap not found")
+    encoding = "gzip" if accepts_encoding(request.headers.get("accept-encoding", ""), "gzip") else "identity"
+    extra_headers = {"Vary": "Accept-Encoding"}
+    if encoding == "gzip":
+        extra_headers["Content-Encoding"] = "gzip"
+    return conditional_response(
+        request, document[encoding], "application/xml",
+        last_modified=document["last_modified"], cache_control=CACHE_CONTROL_STATIC,
+        etag=document["etag"][encoding], extra_headers=extra_headers
+    )
+
 # Existing routes
 @api_router.get("/")
 async def root():
@@ -603,40 +907,12 @@ async def root():
 
 # SEO Routes - Sitemap and Robots.txt
 @api_router.get("/sitemap.xml")
-async def get_sitemap():
-    """Generate XML sitemap for SEO"""
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    
-    pages = [
-        {"loc": f"{BASE_URL}/", "priority": "1.0", "changefreq": "weekly"},
-        {"loc": f"{BASE_URL}/services", "priority": "0.9", "changefreq": "weekly"},
-        {"loc": f"{BASE_URL}/get-quote", "priority": "0.9", "changefreq": "monthly"},
-        {"loc": f"{BASE_URL}/proof", "priority": "0.8", "changefreq": "weekly"},
-        {"loc": f"{BASE_URL}/tools", "priority": "0.8", "changefreq": "monthly"},
-        {"loc": f"{BASE_URL}/about", "priority": "0.7", "changefreq": "monthly"},
-        {"loc": f"{BASE_URL}/contact", "priority": "0.7", "changefreq": "monthly"},
-        {"loc": f"{BASE_URL}/blog", "priority": "0.7", "changefreq": "daily"},
-        {"loc": f"{BASE_URL}/newreach-transport", "priority": "0.6", "changefreq": "monthly"},
-        {"loc": f"{BASE_URL}/privacy", "priority": "0.3", "changefreq": "yearly"},
-    ]
-    
-    xml_content = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xml_content += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-    
-    for page in pages:
-        xml_content += f'''  <url>
-    <loc>{page["loc"]}</loc>
-    <lastmod>{today}</lastmod>
-    <changefreq>{page["changefreq"]}</changefreq>
-    <priority>{page["priority"]}</priority>
-  </url>\n'''
-    
-    xml_content += '</urlset>'
-    
-    return Response(content=xml_content, media_type="application/xml")
+async def get_sitemap(request: Request):
+    """Serve the XML sitemap of core pages for SEO"""
+    return await sitemap_response(request, "main")
 
 @api_router.get("/robots.txt")
-async def get_robots():
+async def get_robots(request: Request):
     """Generate robots.txt for SEO"""
     robots_content = f"""# robots.txt for pjcwebdesigns.net
 User-agent: *
@@ -653,7 +929,7 @@ Allow: /
 
 Crawl-delay: 1
 """
-    return Response(content=robots_content, media_type="text/plain")
+    return conditional_response(request, robots_content, "text/plain", last_modified=APP_STARTED_AT, cache_control=CACHE_CONTROL_STATIC)
 
 # Admin authentication models and endpoints
 class AdminLoginRequest(BaseModel):
@@ -681,51 +957,203 @@ async def verify_admin(_: None = Depends(verify_admin_key)):
     """Verify admin API key is valid"""
     return {"valid": True, "message": "API key is valid"}
 
+# Keyset (cursor) pagination helpers
+# Pages are ordered newest first by (timestamp, id); the cursor carries the
+# last row's sort key so every page is a bounded index range scan, no skip.
+KEYSET_SORT = [("timestamp", DESCENDING), ("id", DESCENDING)]
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(doc: Dict) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    timestamp = doc.get("timestamp")
+    payload = {
+        "t": timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
+        "d": isinstance(timestamp, datetime),
+        "i": doc.get("id")
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by encode_cursor into (timestamp, id)"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = datetime.fromisoformat(payload["t"]) if payload.get("d") else payload["t"]
+        return timestamp, payload["i"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def fetch_keyset_page(collection, filter_query: Dict, limit: int, cursor: Optional[str] = None) -> tuple:
+    """Fetch one page of documents and the cursor for the next page (None on the last page)"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = dict(filter_query)
+    if cursor:
+        timestamp, last_id = decode_cursor(cursor)
+        # The $lte bound keeps this a single index range; $or breaks timestamp ties by id
+        query["timestamp"] = {"$lte": timestamp}
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "id": {"$lt": last_id}}
+        ]
+    
+    # Fetch one extra row to learn whether another page exists
+    docs = await collection.find(query, {"_id": 0}).sort(KEYSET_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+# Streaming export helpers
+# Rows are pulled from a Motor cursor in batches and written out as they
+# arrive, so an export uses constant memory regardless of collection size.
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_BATCH_SIZE = 500
+
+def export_json_default(value):
+    """JSON fallback for values Mongo returns that json.dumps cannot encode"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def export_csv_value(value):
+    """Flatten a document value into a single CSV cell"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=export_json_default)
+    return value
+
+async def stream_export_rows(cursor, export_format: str, columns: List[str]):
+    """Yield an export body chunk by chunk from a Motor cursor"""
+    if export_format == "ndjson":
+        chunk = []
+        async for doc in cursor:
+            chunk.append(json.dumps(doc, default=export_json_default))
+            if len(chunk) >= EXPORT_BATCH_SIZE:
+                yield ("\n".join(chunk) + "\n").encode()
+                chunk = []
+        if chunk:
+            yield ("\n".join(chunk) + "\n").encode()
+        return
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    rows = 0
+    async for doc in cursor:
+        writer.writerow([export_csv_value(doc.get(column)) for column in columns])
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue().encode()
+
+def export_response(collection, filter_query: Dict, export_format: str, columns: List[str], filename: str) -> StreamingResponse:
+    """Build a streaming CSV/NDJSON response over a filtered collection"""
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported export format (use csv or ndjson)")
+    cursor = collection.find(filter_query, {"_id": 0}).sort(KEYSET_SORT).batch_size(EXPORT_BATCH_SIZE)
+    return StreamingResponse(
+        stream_export_rows(cursor, export_format, columns),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
+
 # Payment Dashboard Endpoints
 @api_router.get("/admin/payments")
-async def get_payments(status: Optional[str] = None, limit: int = 100, _: None = Depends(verify_admin_key)):
-    """Get all payment transactions for admin dashboard"""
+async def get_payments(response: Response, status: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None, _: None = Depends(verify_admin_key)):
+    """Get payment transactions for admin dashboard, newest first.
+    
+    Pass the X-Next-Cursor response header back as `cursor` to fetch the next page.
+    """
     try:
         filter_query = {}
         if status:
             filter_query["payment_status"] = status
         
-        transactions = await db.payment_transactions.find(filter_query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
+        transactions, next_cursor = await fetch_keyset_page(db.payment_transactions, filter_query, limit, cursor)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         return transactions
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Get payments error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get payments")
 
+@api_router.get("/admin/payments/export")
+async def export_payments(status: Optional[str] = None, export_format: str = Query("csv", alias="format"), _: None = Depends(verify_admin_key)):
+    """Stream payment transactions as CSV or NDJSON (PROTECTED)"""
+    filter_query = {}
+    if status:
+        filter_query["payment_status"] = status
+    columns = list(PaymentTransaction.__fields__) + ["updated_at", "webhook_processed"]
+    return export_response(db.payment_transactions, filter_query, export_format, columns, "payments")
+
+# Statuses that represent captured money (Stripe/PayPal flows write "paid")
+SETTLED_PAYMENT_STATUSES = ["paid", "completed"]
+
 @api_router.get("/admin/payments/stats")
-async def get_payment_stats(_: None = Depends(verify_admin_key)):
-    """Get payment statistics for dashboard"""
-    try:
-        total = await db.payment_transactions.count_documents({})
-        completed = await db.payment_transactions.count_documents({"payment_status": "completed"})
-        pending = await db.payment_transactions.count_documents({"payment_status": "pending"})
-        failed = await db.payment_transactions.count_documents({"payment_status": "failed"})
-        
-        # Calculate total revenue from completed payments
-        pipeline = [
-            {"$match": {"payment_status": "completed"}},
-            {"$group": {"_id": None, "total_revenue": {"$sum": "$amount"}}}
-        ]
-        revenue_result = await db.payment_transactions.aggregate(pipeline).to_list(1)
-        total_revenue = revenue_result[0]["total_revenue"] if revenue_result else 0
+async def get_payment_stats(since: Optional[datetime] = None, until: Optional[datetime] = None, _: None = Depends(verify_admin_key)):
+    """Get payment statistics for dashboard in a single aggregation pass"""
+    try:
+        window = {}
+        if since:
+            window["$gte"] = as_utc(since)
+        if until:
+            window["$lt"] = as_utc(until)
+        
+        settled = {"$match": {"payment_status": {"$in": SETTLED_PAYMENT_STATUSES}}}
+        # Stripe sessions are created without a payment_method in metadata
+        method = {"$ifNull": ["$metadata.payment_method", "stripe"]}
+        
+        pipeline = [{"$match": {"timestamp": window}}] if window else []
+        pipeline.append({"$facet": {
+            "by_status": [
+                {"$group": {"_id": "$payment_status", "count": {"$sum": 1}}}
+            ],
+            "by_method": [
+                settled,
+                {"$group": {"_id": method, "count": {"$sum": 1}, "revenue": {"$sum": "$amount"}}}
+            ],
+            "by_package": [
+                settled,
+                {"$group": {"_id": "$package_id", "count": {"$sum": 1}, "revenue": {"$sum": "$amount"}}},
+                {"$sort": {"revenue": -1}}
+            ]
+        }})
+        result = await db.payment_transactions.aggregate(pipeline).to_list(1)
+        facets = result[0] if result else {}
+        
+        by_status = {bucket["_id"] or "unknown": bucket["count"] for bucket in facets.get("by_status", [])}
+        by_method = {bucket["_id"]: bucket for bucket in facets.get("by_method", [])}
+        by_package = facets.get("by_package", [])
         
-        # Get payments by method
-        stripe_count = await db.payment_transactions.count_documents({"metadata.payment_method": "stripe", "payment_status": "completed"})
-        paypal_count = await db.payment_transactions.count_documents({"metadata.payment_method": "paypal", "payment_status": "completed"})
+        completed = sum(by_status.get(status, 0) for status in SETTLED_PAYMENT_STATUSES)
+        total_revenue = sum(bucket["revenue"] for bucket in by_package)
         
         return {
-            "total": total,
+            "total": sum(by_status.values()),
             "completed": completed,
-            "pending": pending,
-            "failed": failed,
+            "pending": by_status.get("pending", 0),
+            "failed": by_status.get("failed", 0),
+            "by_status": by_status,
             "total_revenue": round(total_revenue, 2),
+            "average_order_value": round(total_revenue / completed, 2) if completed else 0,
             "by_method": {
-                "stripe": stripe_count,
-                "paypal": paypal_count
+                "stripe": by_method.get("stripe", {}).get("count", 0),
+                "paypal": by_method.get("paypal", {}).get("count", 0)
+            },
+            "revenue_by_method": {
+                name: round(bucket["revenue"], 2) for name, bucket in by_method.items()
+            },
+            "revenue_by_package": [
+                {"package_id": bucket["_id"], "count": bucket["count"], "revenue": round(bucket["revenue"], 2)}
+                for bucket in by_package
+            ],
+            "window": {
+                "since": since.isoformat() if since else None,
+                "until": until.isoformat() if until else None
             }
         }
     except Exception as e:
@@ -751,16 +1179,12 @@ async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
     status_data = status_obj.dict()
-    status_data['timestamp'] = status_data['timestamp'].isoformat()
     _ = await db.status_checks.insert_one(status_data)
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
     status_checks = await db.status_checks.find().to_list(1000)
-    for check in status_checks:
-        if isinstance(check.get('timestamp'), str):
-            check['timestamp'] = datetime.fromisoformat(check['timestamp'])
     return [StatusCheck(**status_check) for status_check in status_checks]
 
 # Chat endpoint
@@ -790,7 +1214,6 @@ async def chat_with_ai(request: ChatRequest):
         )
         
         chat_dict = chat_data.dict()
-        chat_dict['timestamp'] = chat_dict['timestamp'].isoformat()
         await db.chat_messages.insert_one(chat_dict)
         
         return {
@@ -807,7 +1230,6 @@ async def chat_with_ai(request: ChatRequest):
 async def submit_contact_form(form: ContactForm):
     try:
         form_dict = form.dict()
-        form_dict['timestamp'] = form_dict['timestamp'].isoformat()
         await db.contact_forms.insert_one(form_dict)
         return {"message": "Contact form submitted successfully", "id": form.id}
     except Exception as e:
@@ -820,7 +1242,6 @@ async def create_affiliate_link(link_data: AffiliateLinkCreate):
     try:
         affiliate_link = AffiliateLink(**link_data.dict())
         link_dict = affiliate_link.dict()
-        link_dict['timestamp'] = link_dict['timestamp'].isoformat()
         await db.affiliate_links.insert_one(link_dict)
         return affiliate_link
     except Exception as e:
@@ -830,11 +1251,10 @@ async def create_affiliate_link(link_data: AffiliateLinkCreate):
 @api_router.get("/affiliate", response_model=List[AffiliateLink])
 async def get_affiliate_links():
     try:
-        links = await db.affiliate_links.find().to_list(1000)
-        for link in links:
-            if isinstance(link.get('timestamp'), str):
-                link['timestamp'] = datetime.fromisoformat(link['timestamp'])
-        return [AffiliateLink(**link) for link in links]
+        links = await db.affiliate_links.find({}, model_projection(AffiliateLink)).to_list(1000)
+        links = fill_model_defaults(AffiliateLink, links)
+        counter_coalescer.apply_pending("affiliate_links", links, ["clicks"])
+        return trusted_json_response(links)
     except Exception as e:
         logging.error(f"Get affiliate links error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get affiliate links")
@@ -842,13 +1262,12 @@ async def get_affiliate_links():
 @api_router.post("/affiliate/{link_id}/click")
 async def track_affiliate_click(link_id: str):
     try:
-        result = await db.affiliate_links.update_one(
-            {"id": link_id},
-            {"$inc": {"clicks": 1}}
-        )
-        if result.modified_count == 0:
+        if not await db.affiliate_links.find_one({"id": link_id}, {"_id": 1}):
             raise HTTPException(status_code=404, detail="Affiliate link not found")
+        counter_coalescer.increment("affiliate_links", link_id, "clicks")
         return {"message": "Click tracked successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Click tracking error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to track click")
@@ -908,7 +1327,6 @@ async def create_checkout_session(request: CheckoutRequest, http_request: Reques
         )
         
         transaction_dict = transaction.dict()
-        transaction_dict['timestamp'] = transaction_dict['timestamp'].isoformat()
         await db.payment_transactions.insert_one(transaction_dict)
         
         return {
@@ -949,7 +1367,7 @@ async def get_checkout_status(session_id: str):
                         "$set": {
                             "payment_status": checkout_status.payment_status,
                             "status": checkout_status.status,
-                            "updated_at": datetime.now(timezone.utc).isoformat()
+                            "updated_at": datetime.now(timezone.utc)
                         }
                     }
                 )
@@ -996,7 +1414,7 @@ async def stripe_webhook(request: Request):
                         "payment_status": webhook_response.payment_status,
                         "status": "completed",
                         "webhook_processed": True,
-                        "updated_at": datetime.now(timezone.utc).isoformat()
+                        "updated_at": datetime.now(timezone.utc)
                     }
                 }
             )
@@ -1009,8 +1427,13 @@ async def stripe_webhook(request: Request):
         raise HTTPException(status_code=500, detail="Webhook processing failed")
 
 @api_router.get("/packages")
-async def get_packages():
+async def get_packages(request: Request):
     """Get available pricing packages"""
+    catalog = get_pricing_tables()["catalog"]
+    return conditional_response(request, catalog["body"], etag=catalog["etag"], last_modified=APP_STARTED_AT, cache_control=CACHE_CONTROL_STATIC)
+
+def build_package_catalog() -> Dict:
+    """Public package catalog derived from PACKAGES"""
     return {
         "packages": [
             {
@@ -1077,44 +1500,51 @@ async def get_packages():
     }
 
 # Blog endpoints
+def latest_timestamp(docs: List[Dict]) -> Optional[datetime]:
+    """Most recent `timestamp` among documents, used as Last-Modified"""
+    timestamps = [doc["timestamp"] for doc in docs if isinstance(doc.get("timestamp"), datetime)]
+    return max(timestamps) if timestamps else None
+
 @api_router.get("/blog", response_model=List[BlogPost])
-async def get_blog_posts(limit: int = 10, category: Optional[str] = None):
+async def get_blog_posts(request: Request, limit: int = 10, category: Optional[str] = None):
     try:
         filter_query = {"published": True}
         if category:
             filter_query["category"] = category
-            
-        posts = await db.blog_posts.find(filter_query).sort("timestamp", -1).limit(limit).to_list(limit)
         
-        for post in posts:
-            if isinstance(post.get('timestamp'), str):
-                post['timestamp'] = datetime.fromisoformat(post['timestamp'])
+        async def load():
+            posts = await db.blog_posts.find(filter_query, model_projection(BlogPost)).sort("timestamp", -1).limit(limit).to_list(limit)
+            return fill_model_defaults(BlogPost, posts)
         
-        return [BlogPost(**post) for post in posts]
+        posts = await content_cache.get_or_load("blog", ("list", limit, category), load)
+        return conditional_response(request, posts, last_modified=latest_timestamp(posts))
     except Exception as e:
         logging.error(f"Get blog posts error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get blog posts")
 
 @api_router.get("/blog/categories")
-async def get_blog_categories():
+async def get_blog_categories(request: Request):
     try:
-        categories = await db.blog_posts.distinct("category", {"published": True})
-        return {"categories": categories}
+        async def load():
+            return {"categories": await db.blog_posts.distinct("category", {"published": True})}
+        
+        return conditional_response(request, await content_cache.get_or_load("blog", ("categories",), load))
     except Exception as e:
         logging.error(f"Get blog categories error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get blog categories")
 
 @api_router.get("/blog/{slug}")
-async def get_blog_post(slug: str):
+async def get_blog_post(request: Request, slug: str):
     try:
-        post = await db.blog_posts.find_one({"slug": slug, "published": True})
+        async def load():
+            post = await db.blog_posts.find_one({"slug": slug, "published": True}, model_projection(BlogPost))
+            return fill_model_defaults(BlogPost, [post])[0] if post else None
+        
+        post = await content_cache.get_or_load("blog", ("post", slug), load)
         if not post:
             raise HTTPException(status_code=404, detail="Blog post not found")
         
-        if isinstance(post.get('timestamp'), str):
-            post['timestamp'] = datetime.fromisoformat(post['timestamp'])
-            
-        return BlogPost(**post)
+        return conditional_response(request, post, last_modified=latest_timestamp([post]))
     except HTTPException:
         raise
     except Exception as e:
@@ -1134,8 +1564,9 @@ async def create_blog_post(post_data: BlogPostCreate):
         )
         
         post_dict = blog_post.dict()
-        post_dict['timestamp'] = post_dict['timestamp'].isoformat()
         await db.blog_posts.insert_one(post_dict)
+        await content_cache.invalidate("blog")
+        await invalidate_sitemaps()
         
         return blog_post
     except Exception as e:
@@ -1171,7 +1602,6 @@ async def track_social_share(post_id: str, platform: str):
         )
         
         share_dict = social_share.dict()
-        share_dict['timestamp'] = share_dict['timestamp'].isoformat()
         await db.social_shares.insert_one(share_dict)
         
         # Update click count
@@ -1284,7 +1714,6 @@ async def create_paypal_order(request: PayPalOrderRequest):
         )
         
         transaction_dict = transaction.dict()
-        transaction_dict['timestamp'] = transaction_dict['timestamp'].isoformat()
         await db.payment_transactions.insert_one(transaction_dict)
         
         # Find approval URL
@@ -1334,7 +1763,7 @@ async def capture_paypal_order(order_id: str):
                         "$set": {
                             "payment_status": "paid",
                             "status": "completed",
-                            "updated_at": datetime.now(timezone.utc).isoformat()
+                            "updated_at": datetime.now(timezone.utc)
                         }
                     }
                 )
@@ -1380,7 +1809,7 @@ async def get_paypal_order_status(order_id: str):
                         "$set": {
                             "payment_status": "paid",
                             "status": "completed",
-                            "updated_at": datetime.now(timezone.utc).isoformat()
+                            "updated_at": datetime.now(timezone.utc)
                         }
                     }
                 )
@@ -1419,7 +1848,7 @@ async def paypal_webhook(request: Request):
                         "payment_status": "paid",
                         "status": "completed",
                         "webhook_processed": True,
-                        "updated_at": datetime.now(timezone.utc).isoformat()
+                        "updated_at": datetime.now(timezone.utc)
                     }
                 }
             )
@@ -1432,6 +1861,8 @@ async def paypal_webhook(request: Request):
         raise HTTPException(status_code=500, detail="PayPal webhook processing failed")
 
 # Social Media Content Endpoints
+SOCIAL_ENGAGEMENT_FIELDS = ["likes", "comments", "shares"]
+
 @api_router.get("/social/posts", response_model=List[SocialMediaPost])
 async def get_social_media_posts(limit: int = 6, featured: Optional[bool] = None):
     try:
@@ -1439,13 +1870,14 @@ async def get_social_media_posts(limit: int = 6, featured: Optional[bool] = None
         if featured is not None:
             filter_query["featured"] = featured
             
-        posts = await db.social_media_posts.find(filter_query).sort("timestamp", -1).limit(limit).to_list(limit)
+        async def load():
+            return await db.social_media_posts.find(filter_query, model_projection(SocialMediaPost)).sort("timestamp", -1).limit(limit).to_list(limit)
         
-        for post in posts:
-            if isinstance(post.get('timestamp'), str):
-                post['timestamp'] = datetime.fromisoformat(post['timestamp'])
+        # fill_model_defaults copies, so overlaying pending counters leaves the cached documents untouched
+        posts = fill_model_defaults(SocialMediaPost, await content_cache.get_or_load("social", ("list", limit, featured), load))
+        counter_coalescer.apply_pending("social_media_posts", posts, SOCIAL_ENGAGEMENT_FIELDS)
         
-        return [SocialMediaPost(**post) for post in posts]
+        return trusted_json_response(posts)
     except Exception as e:
         logging.error(f"Get social media posts error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get social media posts")
@@ -1456,8 +1888,8 @@ async def create_social_media_post(post_data: SocialMediaPostCreate):
         social_post = SocialMediaPost(**post_data.dict())
         
         post_dict = social_post.dict()
-        post_dict['timestamp'] = post_dict['timestamp'].isoformat()
         await db.social_media_posts.insert_one(post_dict)
+        await content_cache.invalidate("social")
         
         return social_post
     except Exception as e:
@@ -1467,14 +1899,12 @@ async def create_social_media_post(post_data: SocialMediaPostCreate):
 @api_router.get("/social/posts/{post_id}")
 async def get_social_media_post(post_id: str):
     try:
-        post = await db.social_media_posts.find_one({"id": post_id, "published": True})
+        post = await db.social_media_posts.find_one({"id": post_id, "published": True}, model_projection(SocialMediaPost))
         if not post:
             raise HTTPException(status_code=404, detail="Social media post not found")
         
-        if isinstance(post.get('timestamp'), str):
-            post['timestamp'] = datetime.fromisoformat(post['timestamp'])
-            
-        return SocialMediaPost(**post)
+        posts = counter_coalescer.apply_pending("social_media_posts", fill_model_defaults(SocialMediaPost, [post]), SOCIAL_ENGAGEMENT_FIELDS)
+        return trusted_json_response(posts[0])
     except HTTPException:
         raise
     except Exception as e:
@@ -1488,12 +1918,8 @@ async def engage_with_post(post_id: str, action: str):
         if action not in ["like", "comment", "share"]:
             raise HTTPException(status_code=400, detail="Invalid engagement action")
         
-        # Increment the engagement counter
-        update_field = f"{action}s"
-        await db.social_media_posts.update_one(
-            {"id": post_id},
-            {"$inc": {update_field: 1}}
-        )
+        # Increment the engagement counter (coalesced, written on the next flush)
+        counter_coalescer.increment("social_media_posts", post_id, f"{action}s")
         
         return {"message": f"Engagement tracked for {action}", "action": action}
     except HTTPException:
@@ -1506,100 +1932,211 @@ async def engage_with_post(post_id: str, action: str):
 async def get_featured_social_posts():
     """Get featured social media posts for homepage display"""
     try:
-        posts = await db.social_media_posts.find({
-            "published": True,
-            "featured": True
-        }).sort("timestamp", -1).limit(3).to_list(3)
+        async def load():
+            return await db.social_media_posts.find({
+                "published": True,
+                "featured": True
+            }, model_projection(SocialMediaPost)).sort("timestamp", -1).limit(3).to_list(3)
         
-        for post in posts:
-            if isinstance(post.get('timestamp'), str):
-                post['timestamp'] = datetime.fromisoformat(post['timestamp'])
+        posts = fill_model_defaults(SocialMediaPost, await content_cache.get_or_load("social", ("featured",), load))
+        counter_coalescer.apply_pending("social_media_posts", posts, SOCIAL_ENGAGEMENT_FIELDS)
         
-        return [SocialMediaPost(**post) for post in posts]
+        return trusted_json_response(posts)
     except Exception as e:
         logging.error(f"Get featured social posts error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get featured social posts")
 
 # SEO Endpoints (Extended)
 @api_router.get("/seo/sitemap.xml")
-async def get_extended_sitemap():
-    """Generate extended XML sitemap with blog posts"""
-    
-    # Get blog posts for sitemap
-    try:
-        blog_posts = await db.blog_posts.find({"published": True}).to_list(1000)
-    except:
-        blog_posts = []
-    
-    sitemap_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
-    <url>
-        <loc>{BASE_URL}</loc>
-        <lastmod>2025-01-03</lastmod>
-        <changefreq>weekly</changefreq>
-        <priority>1.0</priority>
-    </url>
-    <url>
-        <loc>{BASE_URL}/services</loc>
-        <lastmod>2025-01-03</lastmod>
-        <changefreq>monthly</changefreq>
-        <priority>0.9</priority>
-    </url>
-    <url>
-        <loc>{BASE_URL}/proof</loc>
-        <lastmod>2025-01-03</lastmod>
-        <changefreq>monthly</changefreq>
-        <priority>0.8</priority>
-    </url>
-    <url>
-        <loc>{BASE_URL}/blog</loc>
-        <lastmod>2025-01-03</lastmod>
-        <changefreq>weekly</changefreq>
-        <priority>0.8</priority>
-    </url>
-    <url>
-        <loc>{BASE_URL}/contact</loc>
-        <lastmod>2025-01-03</lastmod>
-        <changefreq>monthly</changefreq>
-        <priority>0.7</priority>
-    </url>'''
-    
-    # Add blog posts to sitemap
-    for post in blog_posts:
-        sitemap_xml += f'''
-    <url>
-        <loc>{BASE_URL}/blog/{post.get('slug', post.get('id'))}</loc>
-        <lastmod>{post.get('timestamp', '2025-01-03')[:10]}</lastmod>
-        <changefreq>monthly</changefreq>
-        <priority>0.6</priority>
-    </url>'''
-    
-    sitemap_xml += '''
-</urlset>'''
-    
-    return Response(content=sitemap_xml, media_type="application/xml")
+async def get_extended_sitemap(request: Request):
+    """Serve the extended sitemap with blog posts, or the sitemap index once it is sharded"""
+    return await sitemap_response(request, "extended")
+
+@api_router.get("/seo/sitemap-{page}.xml")
+async def get_extended_sitemap_shard(request: Request, page: int):
+    """Serve one shard of the extended sitemap index"""
+    return await sitemap_response(request, f"extended-{page}")
+
+SEO_META = {
+    "title": "PJC Web Designs - AI-Powered Websites That Generate Leads | Kansas City",
+    "description": "Custom web design with AI chatbots & automation that turns visitors into paying customers. Affordable packages starting at $325. Serving Kansas City & nationwide.",
+    "keywords": "web design Kansas City, AI website design, small business website, affordable web design, lead generation website, AI chatbot integration",
+    "canonical": BASE_URL,
+    "og_image": f"{BASE_URL}/og-image.png",
+    "structured_data": {
+        "@context": "https://schema.org",
+        "@type": "ProfessionalService",
+        "name": "PJC Web Designs",
+        "priceRange": "$325-$1625+"
+    }
+}
 
 @api_router.get("/seo/meta")
-async def get_seo_meta():
+async def get_seo_meta(request: Request):
     """Get SEO metadata for dynamic pages"""
+    return conditional_response(request, SEO_META, last_modified=APP_STARTED_AT, cache_control=CACHE_CONTROL_STATIC)
+
+# ============ PRICING TABLES ============
+
+# Catalog and every (package, pages) quote, rendered once from PACKAGES via
+# build_package_catalog / calculate_package_price and kept as JSON bytes
+pricing_tables = {"catalog": None, "quotes": {}, "vectors": None, "fingerprint": None, "built_at": None}
+
+def pricing_fingerprint() -> str:
+    """Hash of the pricing constants the tables were built from"""
+    source = json.dumps([PACKAGES, AI_CONSULTING_PACKAGES], sort_keys=True).encode()
+    return hashlib.sha256(source).hexdigest()[:16]
+
+def prebuilt_json(payload: Any) -> Dict:
+    body = json_bytes(payload)
+    return {"body": body, "etag": content_etag(body)}
+
+def is_flat_rate_package(package: Dict) -> bool:
+    """Moving and transport packages are priced the same for any page count"""
+    return package.get("service_type", "web_design") in ["moving", "transport"]
+
+def rebuild_pricing_tables():
+    """Render the catalog and every quote calculate_package_price can return"""
+    quotes = {}
+    for package_id, package in PACKAGES.items():
+        page_counts = [0] if is_flat_rate_package(package) else range(package.get("max_pages", 50) + 1)
+        for pages in page_counts:
+            quotes[(package_id, pages)] = prebuilt_json(calculate_package_price(package_id, pages))
+    pricing_tables.update({
+        "catalog": prebuilt_json(build_package_catalog()),
+        "quotes": quotes,
+        "vectors": build_price_vectors(),
+        "fingerprint": pricing_fingerprint(),
+        "built_at": datetime.now(timezone.utc)
+    })
+
+def build_price_vectors() -> Dict:
+    """Per-package pricing parameters as arrays for vectorized comparisons"""
+    package_ids = list(PACKAGES)
+    packages = [PACKAGES[package_id] for package_id in package_ids]
     return {
-        "title": "PJC Web Designs - AI-Powered Websites That Generate Leads | Kansas City",
-        "description": "Custom web design with AI chatbots & automation that turns visitors into paying customers. Affordable packages starting at $325. Serving Kansas City & nationwide.",
-        "keywords": "web design Kansas City, AI website design, small business website, affordable web design, lead generation website, AI chatbot integration",
-        "canonical": BASE_URL,
-        "og_image": f"{BASE_URL}/og-image.png",
-        "structured_data": {
-            "@context": "https://schema.org",
-            "@type": "ProfessionalService",
-            "name": "PJC Web Designs",
-            "priceRange": "$325-$1625+"
+        "package_ids": package_ids,
+        "service_types": np.array([package.get("service_type", "web_design") for package in packages]),
+        "base_price": np.array([package["base_price"] for package in packages], dtype=float),
+        "included_pages": np.array([package.get("included_pages", 0) for package in packages]),
+        "additional_page_price": np.array([package.get("additional_page_price", 0) for package in packages], dtype=float),
+        "max_pages": np.array([package.get("max_pages", 50) for package in packages]),
+        "flat_rate": np.array([is_flat_rate_package(package) for package in packages])
+    }
+
+def get_pricing_tables() -> Dict:
+    if pricing_tables["catalog"] is None:
+        rebuild_pricing_tables()
+    return pricing_tables
+
+def lookup_quote(package_id: str, pages: int) -> Optional[Dict]:
+    """Prebuilt quote, or None when calculate_package_price has to decide (unknown package, out of range)"""
+    package = PACKAGES.get(package_id)
+    if package is None:
+        return None
+    return get_pricing_tables()["quotes"].get((package_id, 0 if is_flat_rate_package(package) else pages))
+
+QUOTE_BATCH_MAX_ITEMS = 500
+
+class QuoteRequest(BaseModel):
+    package_id: str
+    pages: int = 0
+
+class QuoteBatchRequest(BaseModel):
+    quotes: List[QuoteRequest]
+
+def batch_quote_body(quote_requests: List[QuoteRequest]) -> bytes:
+    """One JSON body for many quotes, spliced from the prebuilt quote bytes.
+    
+    Each item echoes package_id/pages with either `quote` or the `error`
+    calculate_package_price raises for it; one bad pair doesn't fail the batch.
+    """
+    items = []
+    for item in quote_requests:
+        prefix = f'{{"package_id":{json.dumps(item.package_id)},"pages":{item.pages},'.encode()
+        quote = lookup_quote(item.package_id, item.pages)
+        if quote is not None:
+            items.append(prefix + b'"quote":' + quote["body"] + b"}")
+            continue
+        try:
+            items.append(prefix + b'"quote":' + prebuilt_json(calculate_package_price(item.package_id, item.pages))["body"] + b"}")
+        except HTTPException as e:
+            items.append(prefix + f'"error":{json.dumps(e.detail)}}}'.encode())
+    return b'{"quotes":[' + b",".join(items) + b"]}"
+
+def rank_packages_for_pages(pages: int, service_type: Optional[str] = None) -> List[tuple]:
+    """(package_id, final_price) for every package that can take `pages`, cheapest first.
+    
+    Mirrors calculate_package_price across all packages in one numpy pass:
+    flat-rate packages always qualify at base price, page-priced ones only up
+    to max_pages, with pages <= 0 meaning the included pages. Without a
+    `service_type` only page-priced packages are ranked; a moving deposit is
+    no answer to "cheapest for N pages".
+    """
+    vectors = get_pricing_tables()["vectors"]
+    requested = np.where(pages <= 0, vectors["included_pages"], pages)
+    additional = np.maximum(0, requested - vectors["included_pages"])
+    prices = np.where(vectors["flat_rate"], vectors["base_price"], vectors["base_price"] + additional * vectors["additional_page_price"])
+    eligible = vectors["flat_rate"] | (requested <= vectors["max_pages"])
+    if service_type:
+        eligible &= vectors["service_types"] == service_type
+    else:
+        eligible &= ~vectors["flat_rate"]
+    order = np.flatnonzero(eligible)[np.argsort(prices[eligible], kind="stable")]
+    return [(vectors["package_ids"][index], float(prices[index])) for index in order]
+
+@api_router.post("/calculate-price/batch")
+async def calculate_price_batch(batch: QuoteBatchRequest):
+    """Quote many (package_id, pages) pairs in one request"""
+    if len(batch.quotes) > QUOTE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch limited to {QUOTE_BATCH_MAX_ITEMS} quotes")
+    try:
+        return Response(content=batch_quote_body(batch.quotes), media_type="application/json")
+    except Exception as e:
+        logging.error(f"Batch price calculation error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to calculate prices")
+
+@api_router.get("/calculate-price/cheapest")
+async def get_cheapest_package(pages: int = 0, service_type: Optional[str] = None):
+    """Cheapest package able to deliver `pages`, with every eligible package ranked.
+    
+    Ranks the page-priced (web design) packages unless `service_type` picks another line.
+    """
+    try:
+        ranked = rank_packages_for_pages(pages, service_type)
+        if not ranked:
+            raise HTTPException(status_code=404, detail="No package can deliver that many pages")
+        package_id = ranked[0][0]
+        return {
+            "pages": pages,
+            "service_type": service_type,
+            "cheapest": {"package_id": package_id, **calculate_package_price(package_id, pages)},
+            "ranked": [{"package_id": package_id, "final_price": price} for package_id, price in ranked]
         }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Cheapest package error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to find cheapest package")
+
+@api_router.post("/admin/pricing/rebuild")
+async def rebuild_pricing(_: None = Depends(verify_admin_key)):
+    """Rebuild the prebuilt catalog and quote tables after PACKAGES changes (PROTECTED)"""
+    previous = pricing_tables["fingerprint"]
+    rebuild_pricing_tables()
+    return {
+        "fingerprint": pricing_tables["fingerprint"],
+        "changed": previous != pricing_tables["fingerprint"],
+        "quotes": len(pricing_tables["quotes"])
     }
 
 @api_router.get("/calculate-price/{package_id}")
-async def calculate_price_endpoint(package_id: str, pages: int = 0):
+async def calculate_price_endpoint(request: Request, package_id: str, pages: int = 0):
     """Calculate price for a specific package and number of pages"""
     try:
+        quote = lookup_quote(package_id, pages)
+        if quote is not None:
+            return conditional_response(request, quote["body"], etag=quote["etag"], cache_control=CACHE_CONTROL_STATIC)
         pricing = calculate_package_price(package_id, pages)
         return pricing
     except HTTPException as e:
@@ -1609,44 +2146,74 @@ async def calculate_price_endpoint(package_id: str, pages: int = 0):
         raise HTTPException(status_code=500, detail="Failed to calculate price")
 
 @api_router.post("/analytics/page-view")
-async def track_page_view(page: str, referrer: Optional[str] = None):
+async def track_page_view(page: str, referrer: Optional[str] = None, session_id: Optional[str] = None):
     """Track page views for SEO analytics"""
     try:
         view_data = {
             "id": str(uuid.uuid4()),
             "page": page,
             "referrer": referrer,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "session_id": session_id,
+            "timestamp": datetime.now(timezone.utc),
+            "seq": 0,
             "user_agent": "",  # Could be added from request headers
         }
-        await db.page_views.insert_one(view_data)
+        if not page_view_buffer.enqueue(view_data):
+            return {"status": "dropped"}
         return {"status": "tracked"}
     except Exception as e:
         logging.error(f"Analytics tracking error: {str(e)}")
         return {"status": "error"}
 
+UNIQUE_VISITOR_DEFAULT_DAYS = 30
+
 @api_router.get("/analytics/performance")
-async def get_performance_data():
-    """Get basic performance analytics for SEO"""
+async def get_performance_data(since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """Get basic performance analytics for SEO, optionally for a time range"""
     try:
-        # Get page view counts
-        views = await db.page_views.aggregate([
-            {"$group": {"_id": "$page", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
-        ]).to_list(10)
+        # Page view counts come from the hourly buckets, not the raw views
+        hour_range = {}
+        if since:
+            hour_range["$gte"] = hour_bucket(as_utc(since))
+        if until:
+            hour_range["$lt"] = as_utc(until)
+        bucket_pipeline = [{"$match": {"hour": hour_range}}] if hour_range else []
+        bucket_pipeline += [
+            {"$group": {"_id": "$page", "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1}},
+            {"$limit": 10}
+        ]
         
-        # Get contact form submissions count
-        contacts = await db.contact_forms.count_documents({})
+        # Unique visitors default to the last 30 days of daily sketches
+        visitor_since = as_utc(since) if since else datetime.now(timezone.utc) - timedelta(days=UNIQUE_VISITOR_DEFAULT_DAYS)
+        
+        views, contacts, social_stats = await asyncio.gather(
+            db.page_view_buckets.aggregate(bucket_pipeline).to_list(10),
+            # Get contact form submissions count
+            db.contact_forms.count_documents({}),
+            # Get social engagement
+            db.social_shares.aggregate([
+                {"$group": {"_id": "$platform", "shares": {"$sum": 1}}}
+            ]).to_list(10)
+        )
         
-        # Get social engagement
-        social_stats = await db.social_shares.aggregate([
-            {"$group": {"_id": "$platform", "shares": {"$sum": 1}}}
-        ]).to_list(10)
+        # Only the top pages need per-page sketches; the total reads the site-wide ones
+        unique_visitors = await estimate_unique_visitors(
+            visitor_since, as_utc(until) if until else None, pages=[view["_id"] for view in views]
+        )
+        for view in views:
+            view["unique_visitors"] = unique_visitors["by_page"].get(view["_id"], 0)
         
         return {
             "page_views": views,
+            "unique_visitors": unique_visitors["total"],
+            "unique_visitors_basis": UNIQUE_VISITOR_BASIS,
             "contact_submissions": contacts,  
             "social_engagement": social_stats,
+            "range": {
+                "since": since.isoformat() if since else None,
+                "until": until.isoformat() if until else None
+            },
             "last_updated": datetime.now(timezone.utc).isoformat()
         }
     except Exception as e:
@@ -1654,48 +2221,158 @@ async def get_performance_data():
         return {"error": "Failed to get performance data"}
 
 # Lead Generation System Endpoints
+async def upsert_lead(lead_data: LeadCreate) -> tuple:
+    """Create the lead for this email, or touch the existing one, in one atomic round trip.
+    
+    Returns (lead_id, created). The unique index on leads.email makes concurrent
+    submissions of the same email resolve to a single lead.
+    """
+    email = normalize_email(lead_data.email)
+    lead = Lead(**{**lead_data.dict(), "email": email}, lead_score=calculate_lead_score(lead_data), status="new")
+    lead_dict = lead.dict()
+    now = lead_dict.pop("last_activity")
+    
+    for attempt in range(2):
+        try:
+            existing = await db.leads.find_one_and_update(
+                {"email": email},
+                {"$setOnInsert": lead_dict, "$set": {"last_activity": now}},
+                projection={"_id": 0, "id": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return existing["id"], existing["id"] == lead.id
+        except DuplicateKeyError:
+            # Lost an upsert race to a concurrent request; the retry matches its lead
+            if attempt:
+                raise
+
 @api_router.post("/leads")
 async def create_lead(lead_data: LeadCreate):
     """Create a new lead with automatic scoring"""
     try:
-        # Calculate initial lead score
-        score = calculate_lead_score(lead_data)
-        
-        lead = Lead(
-            full_name=lead_data.full_name,
-            email=lead_data.email,
-            phone=lead_data.phone,
-            business_type=lead_data.business_type,
-            biggest_problem=lead_data.biggest_problem,
-            budget_range=lead_data.budget_range,
-            lead_source=lead_data.lead_source,
-            utm_source=lead_data.utm_source,
-            utm_medium=lead_data.utm_medium,
-            utm_campaign=lead_data.utm_campaign,
-            landing_page=lead_data.landing_page,
-            referrer=lead_data.referrer,
-            lead_score=score,
-            status="new"
-        )
+        lead_id, created = await upsert_lead(lead_data)
         
-        lead_dict = lead.dict()
-        lead_dict['timestamp'] = lead_dict['timestamp'].isoformat()
-        lead_dict['last_activity'] = lead_dict['last_activity'].isoformat()
-        if lead_dict.get('booking_datetime'):
-            lead_dict['booking_datetime'] = lead_dict['booking_datetime'].isoformat()
-        await db.leads.insert_one(lead_dict)
+        if not created:
+            return {"success": True, "lead_id": lead_id, "message": "Lead already captured"}
         
         # Log lead creation activity
-        await log_lead_activity(lead.id, "lead_created", {"source": lead_data.lead_source}, 10)
+        await log_lead_activity(lead_id, "lead_created", {"source": lead_data.lead_source}, 10)
         
-        return {"success": True, "lead_id": lead.id, "message": "Lead captured successfully"}
+        return {"success": True, "lead_id": lead_id, "message": "Lead captured successfully"}
     except Exception as e:
         logging.error(f"Create lead error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create lead")
 
+# Bulk lead import (CSV or JSON array from old CRMs, trade-show lists, etc.)
+BULK_IMPORT_MAX_ROWS = 20000
+BULK_IMPORT_CHUNK_SIZE = 1000
+
+def normalize_email(email: str) -> str:
+    """Canonical form used for email lookups and dedupe"""
+    return (email or "").strip().lower()
+
+def parse_bulk_rows(body: bytes, content_type: str) -> List[Dict]:
+    """Parse an import body into row dicts (CSV with header row, or JSON array)"""
+    if "csv" in content_type:
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        # Blank CSV cells mean "not provided", not empty strings
+        return [{k.strip(): (v.strip() or None) for k, v in row.items() if k and v is not None} for row in reader]
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get("leads", [])
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of leads")
+    return data
+
+@api_router.post("/leads/bulk")
+async def bulk_import_leads(request: Request, _: None = Depends(verify_admin_key)):
+    """Import many leads in one request, skipping emails that already exist (PROTECTED)"""
+    started = time.perf_counter()
+    try:
+        try:
+            rows = parse_bulk_rows(await request.body(), request.headers.get("content-type", ""))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid import body: {str(e)}")
+        if len(rows) > BULK_IMPORT_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"Import limited to {BULK_IMPORT_MAX_ROWS} rows per request")
+        
+        errors = []
+        candidates = {}  # normalized email -> (row number, lead document)
+        duplicates = 0
+        for row_number, row in enumerate(rows, start=1):
+            if not isinstance(row, dict):
+                errors.append({"row": row_number, "error": "Row must be an object"})
+                continue
+            try:
+                lead_data = LeadCreate(**{**row, "lead_source": row.get("lead_source") or "import"})
+            except ValidationError as e:
+                errors.append({"row": row_number, "error": str(e)})
+                continue
+            email = normalize_email(lead_data.email)
+            if not email:
+                errors.append({"row": row_number, "error": "Missing email"})
+                continue
+            if email in candidates:
+                duplicates += 1
+                continue
+            lead_data.email = email
+            lead = Lead(**lead_data.dict(), lead_score=calculate_lead_score(lead_data), status="new")
+            candidates[email] = (row_number, lead.dict())
+        
+        # Dedupe against existing leads with one indexed $in lookup per chunk
+        emails = list(candidates)
+        for i in range(0, len(emails), BULK_IMPORT_CHUNK_SIZE):
+            chunk = emails[i:i + BULK_IMPORT_CHUNK_SIZE]
+            async for existing in db.leads.find({"email": {"$in": chunk}}, {"_id": 0, "email": 1}):
+                if candidates.pop(existing["email"], None):
+                    duplicates += 1
+        
+        inserted_ids = []
+        pending = list(candidates.values())
+        for i in range(0, len(pending), BULK_IMPORT_CHUNK_SIZE):
+            chunk = pending[i:i + BULK_IMPORT_CHUNK_SIZE]
+            failed_indexes = set()
+            try:
+                await db.leads.insert_many([doc for _, doc in chunk], ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details.get("writeErrors", []):
+                    failed_indexes.add(write_error["index"])
+                    errors.append({"row": chunk[write_error["index"]][0], "error": write_error.get("errmsg", "Write failed")})
+            inserted_ids.extend(doc["id"] for index, (_, doc) in enumerate(chunk) if index not in failed_indexes)
+        
+        # Creation activities for every lead that was written, in bulk as well
+        score_change = get_activity_score("lead_created")
+        activities = [
+            LeadActivity(lead_id=lead_id, activity_type="lead_created", activity_data={"source": "bulk_import"}, score_change=score_change).dict()
+            for lead_id in inserted_ids
+        ]
+        for i in range(0, len(activities), BULK_IMPORT_CHUNK_SIZE):
+            await db.lead_activities.insert_many(activities[i:i + BULK_IMPORT_CHUNK_SIZE], ordered=False)
+        
+        elapsed = time.perf_counter() - started
+        return {
+            "success": True,
+            "received": len(rows),
+            "inserted": len(inserted_ids),
+            "duplicates": duplicates,
+            "failed": len(errors),
+            "errors": errors[:500],
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "rows_per_second": round(len(rows) / elapsed, 1) if elapsed > 0 else None
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Bulk lead import error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to import leads")
+
 @api_router.get("/leads")
-async def get_leads(status: Optional[str] = None, source: Optional[str] = None, limit: int = 100, _: None = Depends(verify_admin_key)):
-    """Get leads with optional filters for admin dashboard (PROTECTED)"""
+async def get_leads(response: Response, status: Optional[str] = None, source: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None, _: None = Depends(verify_admin_key)):
+    """Get leads with optional filters for admin dashboard (PROTECTED).
+    
+    Pass the X-Next-Cursor response header back as `cursor` to fetch the next page.
+    """
     try:
         filter_query = {}
         if status:
@@ -1703,13 +2380,56 @@ async def get_leads(status: Optional[str] = None, source: Optional[str] = None,
         if source:
             filter_query["lead_source"] = source
             
-        leads = await db.leads.find(filter_query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
+        leads, next_cursor = await fetch_keyset_page(db.leads, filter_query, limit, cursor)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         
         return leads
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Get leads error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get leads")
 
+@api_router.get("/leads/export")
+async def export_leads(status: Optional[str] = None, source: Optional[str] = None, export_format: str = Query("csv", alias="format"), _: None = Depends(verify_admin_key)):
+    """Stream leads as CSV or NDJSON with the same filters as GET /leads (PROTECTED)"""
+    filter_query = {}
+    if status:
+        filter_query["status"] = status
+    if source:
+        filter_query["lead_source"] = source
+    return export_response(db.leads, filter_query, export_format, list(Lead.__fields__), "leads")
+
+@api_router.get("/leads/activities/export")
+async def export_lead_activities(lead_id: Optional[str] = None, export_format: str = Query("csv", alias="format"), _: None = Depends(verify_admin_key)):
+    """Stream lead activities as CSV or NDJSON, optionally for a single lead (PROTECTED)"""
+    filter_query = {"lead_id": lead_id} if lead_id else {}
+    return export_response(db.lead_activities, filter_query, export_format, list(LeadActivity.__fields__), "lead_activities")
+
+@api_router.get("/leads/analytics")
+async def get_lead_analytics(_: None = Depends(verify_admin_key)):
+    """Get lead generation analytics (PROTECTED)"""
+    try:
+        stats, newsletter_subs = await asyncio.gather(
+            aggregate_lead_stats(),
+            db.newsletter_subscriptions.count_documents({"status": "active"})
+        )
+        
+        return {
+            "total_leads": stats["total"],
+            "leads_by_status": stats["by_status"],
+            "leads_by_source": stats["by_source"],
+            "average_score": stats["average_score"],
+            "recent_leads": stats["recent_leads"],
+            "conversion_rate": stats["conversion_rate"],
+            "newsletter_subscribers": newsletter_subs,
+            "last_updated": datetime.now(timezone.utc).isoformat()
+        }
+    except Exception as e:
+        logging.error(f"Lead analytics error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get lead analytics")
+
 @api_router.get("/leads/{lead_id}")
 async def get_lead(lead_id: str, _: None = Depends(verify_admin_key)):
     """Get single lead by ID (PROTECTED)"""
@@ -1724,15 +2444,59 @@ async def get_lead(lead_id: str, _: None = Depends(verify_admin_key)):
         logging.error(f"Get lead error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get lead")
 
+BULK_UPDATE_MAX_LEADS = 10000
+
+@api_router.patch("/leads/bulk")
+async def bulk_update_leads(request: LeadBulkUpdate, _: None = Depends(verify_admin_key)):
+    """Apply one LeadUpdate to many leads by id list or filter (PROTECTED)"""
+    try:
+        if request.lead_ids:
+            query = {"id": {"$in": request.lead_ids}}
+        elif request.filter and (request.filter.status or request.filter.source):
+            query = {}
+            if request.filter.status:
+                query["status"] = request.filter.status
+            if request.filter.source:
+                query["lead_source"] = request.filter.source
+        else:
+            raise HTTPException(status_code=400, detail="Provide lead_ids or a status/source filter")
+        
+        update_dict = {k: v for k, v in request.update.dict().items() if v is not None}
+        if not update_dict:
+            raise HTTPException(status_code=400, detail="No fields to update")
+        
+        # Resolve the matching ids once so the activity log covers exactly the updated leads
+        lead_ids = [doc["id"] async for doc in db.leads.find(query, {"_id": 0, "id": 1}).limit(BULK_UPDATE_MAX_LEADS + 1)]
+        if len(lead_ids) > BULK_UPDATE_MAX_LEADS:
+            raise HTTPException(status_code=413, detail=f"Bulk update limited to {BULK_UPDATE_MAX_LEADS} leads per request")
+        if not lead_ids:
+            return {"success": True, "matched": 0, "modified": 0}
+        
+        now = datetime.now(timezone.utc)
+        activity_type = "status_changed" if "status" in update_dict else "lead_updated"
+        activities = [
+            LeadActivity(lead_id=lead_id, activity_type=activity_type, activity_data=update_dict, score_change=0, timestamp=now).dict()
+            for lead_id in lead_ids
+        ]
+        
+        result, _activities = await asyncio.gather(
+            db.leads.update_many({"id": {"$in": lead_ids}}, {"$set": {**update_dict, "last_activity": now}}),
+            db.lead_activities.insert_many(activities, ordered=False)
+        )
+        
+        return {"success": True, "matched": result.matched_count, "modified": result.modified_count}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Bulk update leads error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to update leads")
+
 @api_router.patch("/leads/{lead_id}")
 async def update_lead(lead_id: str, update_data: LeadUpdate, _: None = Depends(verify_admin_key)):
     """Update lead status, notes, or booking info (PROTECTED)"""
     try:
         update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
-        update_dict['last_activity'] = datetime.now(timezone.utc).isoformat()
-        
-        if update_data.booking_datetime:
-            update_dict['booking_datetime'] = update_data.booking_datetime.isoformat()
+        update_dict['last_activity'] = datetime.now(timezone.utc)
         
         result = await db.leads.update_one(
             {"id": lead_id},
@@ -1767,33 +2531,21 @@ async def delete_lead(lead_id: str, _: None = Depends(verify_admin_key)):
 async def get_leads_stats(_: None = Depends(verify_admin_key)):
     """Get lead statistics for dashboard (PROTECTED)"""
     try:
-        total = await db.leads.count_documents({})
-        new_count = await db.leads.count_documents({"status": "new"})
-        contacted = await db.leads.count_documents({"status": "contacted"})
-        booked = await db.leads.count_documents({"status": "booked"})
-        closed = await db.leads.count_documents({"status": "closed"})
+        stats = await aggregate_lead_stats()
         
-        # Source breakdown
-        organic = await db.leads.count_documents({"lead_source": "organic"})
-        paid = await db.leads.count_documents({"lead_source": "paid"})
-        social = await db.leads.count_documents({"lead_source": "social"})
-        referral = await db.leads.count_documents({"lead_source": "referral"})
+        # Keep the dashboard's four core buckets present even when empty
+        by_status = {"new": 0, "contacted": 0, "booked": 0, "closed": 0}
+        by_status.update({bucket["_id"] or "unknown": bucket["count"] for bucket in stats["by_status"]})
+        by_source = {"organic": 0, "paid": 0, "social": 0, "referral": 0}
+        by_source.update({bucket["_id"] or "unknown": bucket["count"] for bucket in stats["by_source"]})
         
         return {
-            "total": total,
-            "by_status": {
-                "new": new_count,
-                "contacted": contacted,
-                "booked": booked,
-                "closed": closed
-            },
-            "by_source": {
-                "organic": organic,
-                "paid": paid,
-                "social": social,
-                "referral": referral
-            },
-            "conversion_rate": round((closed / total * 100) if total > 0 else 0, 1)
+            "total": stats["total"],
+            "by_status": by_status,
+            "by_source": by_source,
+            "average_score": stats["average_score"],
+            "recent_leads": stats["recent_leads"],
+            "conversion_rate": stats["conversion_rate"]
         }
     except Exception as e:
         logging.error(f"Get lead stats error: {str(e)}")
@@ -1805,22 +2557,30 @@ async def track_lead_activity(lead_id: str, activity_type: str, activity_data: O
     try:
         score_change = get_activity_score(activity_type)
         
-        await log_lead_activity(lead_id, activity_type, activity_data, score_change)
-        
-        # Update lead score and last activity
-        await db.leads.update_one(
-            {"id": lead_id},
-            {
-                "$inc": {"lead_score": score_change},
-                "$set": {"last_activity": datetime.now(timezone.utc).isoformat()}
-            }
-        )
+        await record_lead_activity(lead_id, activity_type, activity_data, score_change)
         
         return {"message": "Activity tracked", "score_change": score_change}
     except Exception as e:
         logging.error(f"Track activity error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to track activity")
 
+@api_router.get("/leads/{lead_id}/activities")
+async def get_lead_activities(lead_id: str, response: Response, limit: int = 50, cursor: Optional[str] = None, _: None = Depends(verify_admin_key)):
+    """Get a lead's activity timeline, newest first (PROTECTED).
+    
+    Pass the X-Next-Cursor response header back as `cursor` to fetch the next page.
+    """
+    try:
+        activities, next_cursor = await fetch_keyset_page(db.lead_activities, {"lead_id": lead_id}, limit, cursor)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return activities
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Get lead activities error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get lead activities")
+
 # Newsletter subscription model
 class NewsletterSubscribeRequest(BaseModel):
     email: str
@@ -1831,36 +2591,41 @@ class NewsletterSubscribeRequest(BaseModel):
 async def subscribe_newsletter(request: NewsletterSubscribeRequest):
     """Subscribe to newsletter"""
     try:
-        # Check if already subscribed
-        existing = await db.newsletter_subscriptions.find_one({"email": request.email})
-        if existing:
-            return {"message": "Already subscribed", "status": "existing"}
-        
+        email = normalize_email(request.email)
         subscription = NewsletterSubscription(
-            email=request.email,
+            email=email,
             name=request.name,
             interests=request.interests
         )
         
-        sub_dict = subscription.dict()
-        sub_dict['timestamp'] = sub_dict['timestamp'].isoformat()
-        await db.newsletter_subscriptions.insert_one(sub_dict)
+        # Insert only if this email is not subscribed yet (unique index on email)
+        try:
+            result = await db.newsletter_subscriptions.update_one(
+                {"email": email},
+                {"$setOnInsert": subscription.dict()},
+                upsert=True
+            )
+            subscribed = result.upserted_id is not None
+        except DuplicateKeyError:
+            subscribed = False
+        if not subscribed:
+            return {"message": "Already subscribed", "status": "existing"}
         
         # Also create/update lead
         lead_data = LeadCreate(
             full_name=request.name or "",
-            email=request.email,
+            email=email,
             lead_source="newsletter"
         )
         
         try:
-            existing_lead = await db.leads.find_one({"email": request.email})
-            if not existing_lead:
-                await create_lead(lead_data)
+            lead_id, created = await upsert_lead(lead_data)
+            if created:
+                await log_lead_activity(lead_id, "lead_created", {"source": "newsletter"}, 10)
             else:
-                await log_lead_activity(existing_lead["id"], "newsletter_signup", {}, 15)
-        except:
-            pass  # Don't fail if lead creation fails
+                await record_lead_activity(lead_id, "newsletter_signup", {}, get_activity_score("newsletter_signup"))
+        except Exception as e:
+            logging.error(f"Newsletter lead capture error: {str(e)}")  # Don't fail the subscription
         
         return {"message": "Newsletter subscription successful", "status": "subscribed"}
     except Exception as e:
@@ -1871,8 +2636,11 @@ async def subscribe_newsletter(request: NewsletterSubscribeRequest):
 async def get_lead_magnets():
     """Get available lead magnets"""
     try:
-        magnets = await db.lead_magnets.find({"active": True}).to_list(10)
-        return magnets
+        async def load():
+            return await db.lead_magnets.find({"active": True}, {"_id": 0}).to_list(10)
+        
+        magnets = [dict(magnet) for magnet in await content_cache.get_or_load("lead_magnets", ("active",), load)]
+        return counter_coalescer.apply_pending("lead_magnets", magnets, ["download_count"])
     except Exception as e:
         logging.error(f"Get lead magnets error: {str(e)}")
         return []
@@ -1888,23 +2656,19 @@ async def download_lead_magnet(magnet_id: str, email: str, name: Optional[str] =
         
         # Create/update lead
         lead_data = LeadCreate(
+            full_name=name or "",
             email=email,
-            name=name,
-            lead_source="lead_magnet",
-            lead_magnet=magnet["title"]
+            lead_source="lead_magnet"
         )
         
-        existing_lead = await db.leads.find_one({"email": email})
-        if not existing_lead:
-            await create_lead(lead_data)
+        lead_id, created = await upsert_lead(lead_data)
+        if created:
+            await log_lead_activity(lead_id, "lead_created", {"source": "lead_magnet", "magnet": magnet["title"]}, 10)
         else:
-            await log_lead_activity(existing_lead["id"], "magnet_download", {"magnet": magnet["title"]}, 25)
+            await record_lead_activity(lead_id, "magnet_download", {"magnet": magnet["title"]}, get_activity_score("magnet_download"))
         
-        # Update download count
-        await db.lead_magnets.update_one(
-            {"id": magnet_id},
-            {"$inc": {"download_count": 1}}
-        )
+        # Update download count (coalesced, written on the next flush)
+        counter_coalescer.increment("lead_magnets", magnet_id, "download_count")
         
         return {
             "message": "Lead magnet accessed successfully",
@@ -1917,50 +2681,6 @@ async def download_lead_magnet(magnet_id: str, email: str, name: Optional[str] =
         logging.error(f"Download lead magnet error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to download lead magnet")
 
-@api_router.get("/leads/analytics")
-async def get_lead_analytics(_: None = Depends(verify_admin_key)):
-    """Get lead generation analytics (PROTECTED)"""
-    try:
-        # Total leads
-        total_leads = await db.leads.count_documents({})
-        
-        # Leads by status
-        leads_by_status = await db.leads.aggregate([
-            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-        ]).to_list(10)
-        
-        # Leads by source
-        leads_by_source = await db.leads.aggregate([
-            {"$group": {"_id": "$lead_source", "count": {"$sum": 1}}}
-        ]).to_list(10)
-        
-        # Average lead score
-        avg_score = await db.leads.aggregate([
-            {"$group": {"_id": None, "avg_score": {"$avg": "$lead_score"}}}
-        ]).to_list(1)
-        
-        # Recent leads (last 7 days)
-        seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        recent_leads = await db.leads.count_documents({
-            "timestamp": {"$gte": seven_days_ago.isoformat()}
-        })
-        
-        # Newsletter subscribers
-        newsletter_subs = await db.newsletter_subscriptions.count_documents({"status": "active"})
-        
-        return {
-            "total_leads": total_leads,
-            "leads_by_status": leads_by_status,
-            "leads_by_source": leads_by_source,
-            "average_score": avg_score[0]["avg_score"] if avg_score else 0,
-            "recent_leads": recent_leads,
-            "newsletter_subscribers": newsletter_subs,
-            "last_updated": datetime.now(timezone.utc).isoformat()
-        }
-    except Exception as e:
-        logging.error(f"Lead analytics error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to get lead analytics")
-
 # Helper Functions
 def calculate_lead_score(lead_data: LeadCreate) -> int:
     """Calculate initial lead score based on provided information"""
@@ -2018,6 +2738,47 @@ def get_activity_score(activity_type: str) -> int:
     }
     return activity_scores.get(activity_type, 0)
 
+async def aggregate_lead_stats(recent_days: int = 7) -> Dict:
+    """Compute all lead dashboard statistics in a single $facet pass over db.leads"""
+    since = datetime.now(timezone.utc) - timedelta(days=recent_days)
+    pipeline = [
+        {"$facet": {
+            "summary": [
+                {"$group": {"_id": None, "total": {"$sum": 1}, "avg_score": {"$avg": "$lead_score"}}}
+            ],
+            "by_status": [
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}}
+            ],
+            "by_source": [
+                {"$group": {"_id": "$lead_source", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}}
+            ],
+            "recent": [
+                {"$match": {"timestamp": {"$gte": since}}},
+                {"$count": "count"}
+            ]
+        }}
+    ]
+    result = await db.leads.aggregate(pipeline).to_list(1)
+    facets = result[0] if result else {}
+    
+    summary = facets.get("summary") or [{}]
+    total = summary[0].get("total", 0)
+    average_score = summary[0].get("avg_score") or 0
+    recent = facets.get("recent") or [{}]
+    by_status = facets.get("by_status", [])
+    closed = sum(bucket["count"] for bucket in by_status if bucket["_id"] == "closed")
+    
+    return {
+        "total": total,
+        "by_status": by_status,
+        "by_source": facets.get("by_source", []),
+        "average_score": round(average_score, 1),
+        "recent_leads": recent[0].get("count", 0),
+        "conversion_rate": round((closed / total * 100) if total > 0 else 0, 1)
+    }
+
 async def log_lead_activity(lead_id: str, activity_type: str, activity_data: Optional[Dict], score_change: int):
     """Log lead activity"""
     try:
@@ -2029,11 +2790,41 @@ async def log_lead_activity(lead_id: str, activity_type: str, activity_data: Opt
         )
         
         activity_dict = activity.dict()
-        activity_dict['timestamp'] = activity_dict['timestamp'].isoformat()
         await db.lead_activities.insert_one(activity_dict)
     except Exception as e:
         logging.error(f"Log activity error: {str(e)}")
 
+async def record_lead_activity(lead_id: str, activity_type: str, activity_data: Optional[Dict], score_change: int):
+    """Log an activity and apply its score change to the lead, capped to 0-100.
+    
+    Runs both writes in one transaction when the deployment supports it,
+    otherwise issues them concurrently.
+    """
+    now = datetime.now(timezone.utc)
+    activity_dict = LeadActivity(
+        lead_id=lead_id,
+        activity_type=activity_type,
+        activity_data=activity_data,
+        score_change=score_change,
+        timestamp=now
+    ).dict()
+    # Pipeline update so the cap is applied atomically on the server
+    score_update = [{"$set": {
+        "lead_score": {"$min": [100, {"$max": [0, {"$add": [{"$ifNull": ["$lead_score", 0]}, score_change]}]}]},
+        "last_activity": now
+    }}]
+    
+    if mongo_supports_transactions:
+        async with await client.start_session() as session:
+            async with session.start_transaction():
+                await db.lead_activities.insert_one(activity_dict, session=session)
+                await db.leads.update_one({"id": lead_id}, score_update, session=session)
+    else:
+        await asyncio.gather(
+            db.lead_activities.insert_one(activity_dict),
+            db.leads.update_one({"id": lead_id}, score_update)
+        )
+
 async def send_lead_welcome_email(email: str, name: Optional[str]):
     """Send welcome email to new lead (placeholder for email integration)"""
     try:
@@ -2066,6 +2857,12 @@ class ContentResearchRequest(BaseModel):
     topic: str
     industry: Optional[str] = None
 
+# Crawler tools re-fetch the same pages while a user iterates; keep the analyzed
+# summary of successful fetches briefly (never the raw HTML) in a small per-worker cache
+CRAWL_CACHE_TTL_SECONDS = 600
+CRAWL_CACHE_MAX_ENTRIES = 256
+CRAWL_CACHE_MAX_ENTRY_BYTES = 16_384
+
 async def fetch_url(url: str) -> tuple:
     """Fetch URL content with error handling"""
     try:
@@ -2086,6 +2883,26 @@ async def fetch_url(url: str) -> tuple:
     except Exception as e:
         return None, str(e)
 
+async def crawl_page(url: str) -> tuple:
+    """Fetch and analyze a page, served from the crawl cache when fresh.
+    
+    Returns ({"seo_data", "contact_info", "technologies"}, error).
+    """
+    async def load():
+        html, error = await fetch_url(url)
+        if error:
+            return None, error
+        return {
+            "seo_data": extract_seo_data(html, url),
+            "contact_info": extract_contact_info(html),
+            "technologies": detect_technologies(html)
+        }, None
+    
+    return await crawl_cache.get_or_load(
+        "crawl", (url,), load,
+        cache_if=lambda result: result[0] is not None and len(json.dumps(result[0])) <= CRAWL_CACHE_MAX_ENTRY_BYTES
+    )
+
 def extract_seo_data(html: str, url: str) -> dict:
     """Extract SEO-relevant data from HTML"""
     soup = BeautifulSoup(html, 'html.parser')
@@ -2139,8 +2956,35 @@ def extract_seo_data(html: str, url: str) -> dict:
         "word_count": word_count
     }
 
-def extract_contact_info(html: str) -> dict:
-    """Extract contact information from HTML"""
+def detect_technologies(html: str) -> List[str]:
+    """Basic framework/platform detection from page source"""
+    technologies = []
+    
+    # Check for common frameworks/tools
+    html_lower = html.lower()
+    if 'react' in html_lower or 'reactdom' in html_lower:
+        technologies.append("React")
+    if 'vue' in html_lower:
+        technologies.append("Vue.js")
+    if 'angular' in html_lower:
+        technologies.append("Angular")
+    if 'wordpress' in html_lower or 'wp-content' in html_lower:
+        technologies.append("WordPress")
+    if 'shopify' in html_lower:
+        technologies.append("Shopify")
+    if 'wix' in html_lower:
+        technologies.append("Wix")
+    if 'squarespace' in html_lower:
+        technologies.append("Squarespace")
+    if 'bootstrap' in html_lower:
+        technologies.append("Bootstrap")
+    if 'tailwind' in html_lower:
+        technologies.append("Tailwind CSS")
+    
+    return technologies
+
+def extract_contact_info(html: str) -> dict:
+    """Extract contact information from HTML"""
     soup = BeautifulSoup(html, 'html.parser')
     text = soup.get_text()
     
@@ -2251,13 +3095,13 @@ def analyze_website_quality(seo_data: dict) -> dict:
 async def analyze_website(request: WebsiteAnalysisRequest):
     """Analyze a website for SEO, content, and quality"""
     try:
-        html, error = await fetch_url(request.url)
+        page, error = await crawl_page(request.url)
         
         if error:
             return {"success": False, "error": f"Could not fetch website: {error}"}
         
-        seo_data = extract_seo_data(html, request.url)
-        contact_info = extract_contact_info(html)
+        seo_data = page["seo_data"]
+        contact_info = page["contact_info"]
         quality_analysis = analyze_website_quality(seo_data)
         
         # Use AI to generate insights if available
@@ -2369,38 +3213,14 @@ async def find_business_leads(request: BusinessSearchRequest):
 async def analyze_competitor(request: CompetitorAnalysisRequest):
     """Analyze a competitor's website"""
     try:
-        html, error = await fetch_url(request.competitor_url)
+        page, error = await crawl_page(request.competitor_url)
         
         if error:
             return {"success": False, "error": f"Could not fetch competitor site: {error}"}
         
-        seo_data = extract_seo_data(html, request.competitor_url)
-        contact_info = extract_contact_info(html)
-        
-        # Extract technologies (basic detection)
-        soup = BeautifulSoup(html, 'html.parser')
-        technologies = []
-        
-        # Check for common frameworks/tools
-        html_lower = html.lower()
-        if 'react' in html_lower or 'reactdom' in html_lower:
-            technologies.append("React")
-        if 'vue' in html_lower:
-            technologies.append("Vue.js")
-        if 'angular' in html_lower:
-            technologies.append("Angular")
-        if 'wordpress' in html_lower or 'wp-content' in html_lower:
-            technologies.append("WordPress")
-        if 'shopify' in html_lower:
-            technologies.append("Shopify")
-        if 'wix' in html_lower:
-            technologies.append("Wix")
-        if 'squarespace' in html_lower:
-            technologies.append("Squarespace")
-        if 'bootstrap' in html_lower:
-            technologies.append("Bootstrap")
-        if 'tailwind' in html_lower:
-            technologies.append("Tailwind CSS")
+        seo_data = page["seo_data"]
+        contact_info = page["contact_info"]
+        technologies = page["technologies"]
         
         # AI-powered competitive analysis
         ai_analysis = None
@@ -2494,6 +3314,1012 @@ async def research_content(request: ContentResearchRequest):
         logging.error(f"Content research error: {str(e)}")
         raise HTTPException(status_code=500, detail="Research failed")
 
+# ============ WRITE-BEHIND BUFFERS ============
+
+class WriteBehindBuffer:
+    """Bounded in-process buffer that batches inserts into one collection.
+    
+    Hits are enqueued without touching Mongo and written with insert_many once
+    `batch_size` documents are waiting or every `flush_interval_ms`, whichever
+    comes first. When the buffer is full new documents are dropped and counted
+    rather than blocking the request.
+    """
+    
+    def __init__(self, collection_name: str, max_size: int = 10000, batch_size: int = 500, flush_interval_ms: int = 1000, after_flush=None):
+        self.collection_name = collection_name
+        # Optional coroutine called with each batch of successfully written documents
+        self.after_flush = after_flush
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.queue = deque()
+        self.flush_requested = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        # Set by stop(); the loop exits between flushes instead of being cancelled mid-write
+        self.stopping = asyncio.Event()
+        self.task = None
+        self.stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "written": 0,
+            "write_errors": 0,
+            "batches": 0,
+            "last_flush_at": None
+        }
+    
+    def enqueue(self, doc: Dict) -> bool:
+        """Queue a document for writing; returns False if it was dropped"""
+        if len(self.queue) >= self.max_size:
+            self.stats["dropped"] += 1
+            return False
+        self.queue.append(doc)
+        self.stats["enqueued"] += 1
+        if len(self.queue) >= self.batch_size:
+            self.flush_requested.set()
+        return True
+    
+    async def flush(self):
+        """Write everything currently queued, one insert_many per batch"""
+        async with self.flush_lock:
+            while self.queue:
+                batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+                written = batch
+                try:
+                    await db[self.collection_name].insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                    written = [doc for index, doc in enumerate(batch) if index not in failed]
+                    self.stats["write_errors"] += len(failed)
+                except Exception as e:
+                    written = []
+                    self.stats["write_errors"] += len(batch)
+                    logging.error(f"Write-behind flush error ({self.collection_name}): {str(e)}")
+                self.stats["written"] += len(written)
+                self.stats["batches"] += 1
+                if written and self.after_flush:
+                    try:
+                        await self.after_flush(written)
+                    except Exception as e:
+                        logging.error(f"Write-behind after_flush error ({self.collection_name}): {str(e)}")
+            self.stats["last_flush_at"] = datetime.now(timezone.utc)
+    
+    async def run(self):
+        """Flush loop: on batch-size signal or interval timeout"""
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_requested.clear()
+            # Shielded: a batch popped off the queue must reach insert_many and after_flush
+            await asyncio.shield(self.flush())
+    
+    def start(self):
+        if self.task is None:
+            self.stopping.clear()
+            self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        """Stop the flush loop after its current flush and write whatever is still queued"""
+        if self.task is not None:
+            self.stopping.set()
+            self.flush_requested.set()
+            await self.task
+            self.task = None
+        await asyncio.shield(self.flush())
+    
+    def metrics(self) -> Dict:
+        return {"queue_depth": len(self.queue), "max_size": self.max_size, **self.stats}
+
+# ============ SHARED CACHE ============
+
+CONTENT_CACHE_TTL_SECONDS = int(os.environ.get("CONTENT_CACHE_TTL_SECONDS", "300"))
+CONTENT_CACHE_MAX_ENTRIES = int(os.environ.get("CONTENT_CACHE_MAX_ENTRIES", "1024"))
+# "memory" keeps entries per worker; "redis" shares them (and invalidations) across workers
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = os.environ.get("CACHE_KEY_PREFIX", "pjc")
+# A worker that loses the fill lock polls this long for the winner's value before loading itself
+SINGLE_FLIGHT_LOCK_SECONDS = 10
+SINGLE_FLIGHT_WAIT_SECONDS = 2.0
+
+# Returned by backends for absent keys, so a cached None stays distinguishable
+CACHE_MISS = object()
+CACHE_CODEC_OPTIONS = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+
+class MemoryCacheBackend:
+    """Per-process LRU store with per-entry TTL; right for a single worker"""
+    
+    name = "memory"
+    
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.counters = {}
+        self.evictions = 0
+    
+    async def get(self, key: str) -> Any:
+        entry = self.entries.get(key)
+        if entry is None:
+            return CACHE_MISS
+        if entry[0] <= time.monotonic():
+            del self.entries[key]
+            return CACHE_MISS
+        self.entries.move_to_end(key)
+        return entry[1]
+    
+    async def set(self, key: str, value: Any, ttl_seconds: float):
+        self.entries[key] = (time.monotonic() + ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+    
+    async def get_counter(self, key: str) -> int:
+        return self.counters.get(key, 0)
+    
+    async def incr(self, key: str) -> int:
+        self.counters[key] = self.counters.get(key, 0) + 1
+        return self.counters[key]
+    
+    async def acquire_lock(self, key: str, ttl_seconds: float) -> bool:
+        # In-process single-flight already serializes fills within one worker
+        return True
+    
+    async def release_lock(self, key: str):
+        pass
+    
+    def metrics(self) -> Dict:
+        return {"entries": len(self.entries), "max_entries": self.max_entries, "evictions": self.evictions}
+
+class RedisCacheBackend:
+    """Redis-protocol store shared by every worker.
+    
+    Takes any redis.asyncio-compatible client (a real server or fakeredis).
+    Values are BSON-encoded so datetimes survive the round trip; TTLs map to
+    PX expiries and eviction is left to the server's maxmemory policy.
+    """
+    
+    name = "redis"
+    
+    def __init__(self, client, prefix: str = CACHE_KEY_PREFIX):
+        self.client = client
+        self.prefix = prefix
+    
+    def key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+    
+    async def get(self, key: str) -> Any:
+        data = await self.client.get(self.key(key))
+        if data is None:
+            return CACHE_MISS
+        return bson_decode(data, codec_options=CACHE_CODEC_OPTIONS)["v"]
+    
+    async def set(self, key: str, value: Any, ttl_seconds: float):
+        await self.client.set(self.key(key), bson_encode({"v": value}), px=int(ttl_seconds * 1000))
+    
+    async def get_counter(self, key: str) -> int:
+        return int(await self.client.get(self.key(key)) or 0)
+    
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(self.key(key))
+    
+    async def acquire_lock(self, key: str, ttl_seconds: float) -> bool:
+        return bool(await self.client.set(self.key(key), b"1", nx=True, px=int(ttl_seconds * 1000)))
+    
+    async def release_lock(self, key: str):
+        await self.client.delete(self.key(key))
+    
+    def metrics(self) -> Dict:
+        return {"prefix": self.prefix}
+
+class SharedCache:
+    """Namespaced read-through cache over a pluggable backend.
+    
+    Keys are "namespace:version:parts"; invalidate() increments the namespace
+    version in the backend, so every worker stops reading entries cached before
+    the write. Concurrent misses for one key share a single load: within a
+    worker through an in-flight task, across workers through a short backend lock.
+    Backend errors degrade to calling the loader directly.
+    """
+    
+    def __init__(self, backend, ttl_seconds: int = 300):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.inflight = {}
+        self.stats = {}
+    
+    def namespace_stats(self, namespace: str) -> Dict:
+        return self.stats.setdefault(namespace, {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0, "errors": 0})
+    
+    async def namespace_version(self, namespace: str) -> int:
+        return await self.backend.get_counter(f"ns:{namespace}")
+    
+    async def get_or_load(self, namespace: str, parts: tuple, loader, ttl_seconds: Optional[float] = None, cache_if=None):
+        """Return the cached value for (namespace, parts), calling `loader()` once on a miss.
+        
+        `cache_if(value)` can veto storing a loaded value (e.g. failed fetches).
+        """
+        stats = self.namespace_stats(namespace)
+        try:
+            version = await self.namespace_version(namespace)
+            key = f"{namespace}:{version}:{parts!r}"
+            value = await self.backend.get(key)
+        except Exception as e:
+            stats["errors"] += 1
+            logging.error(f"Cache read error ({namespace}): {str(e)}")
+            return await loader()
+        if value is not CACHE_MISS:
+            stats["hits"] += 1
+            return value
+        
+        stats["misses"] += 1
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.fill(namespace, version, key, loader, ttl_seconds or self.ttl_seconds, cache_if))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            stats["coalesced"] += 1
+        # Shielded so one cancelled request doesn't abort the load others are waiting on
+        return await asyncio.shield(task)
+    
+    async def fill(self, namespace: str, version: int, key: str, loader, ttl_seconds: float, cache_if):
+        stats = self.namespace_stats(namespace)
+        lock_key = f"lock:{key}"
+        try:
+            locked = await self.backend.acquire_lock(lock_key, SINGLE_FLIGHT_LOCK_SECONDS)
+            if not locked:
+                # Another worker is loading this key; wait briefly for its value
+                deadline = time.monotonic() + SINGLE_FLIGHT_WAIT_SECONDS
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    value = await self.backend.get(key)
+                    if value is not CACHE_MISS:
+                        stats["coalesced"] += 1
+                        return value
+        except Exception as e:
+            locked = False
+            stats["errors"] += 1
+            logging.error(f"Cache lock error ({namespace}): {str(e)}")
+        
+        try:
+            value = await loader()
+            try:
+                # Don't store a value loaded across an invalidation; it may predate the write
+                if (cache_if is None or cache_if(value)) and await self.namespace_version(namespace) == version:
+                    await self.backend.set(key, value, ttl_seconds)
+            except Exception as e:
+                stats["errors"] += 1
+                logging.error(f"Cache write error ({namespace}): {str(e)}")
+            return value
+        finally:
+            if locked:
+                try:
+                    await self.backend.release_lock(lock_key)
+                except Exception as e:
+                    logging.error(f"Cache unlock error ({namespace}): {str(e)}")
+    
+    async def invalidate(self, namespace: str):
+        self.namespace_stats(namespace)["invalidations"] += 1
+        try:
+            await self.backend.incr(f"ns:{namespace}")
+        except Exception as e:
+            self.namespace_stats(namespace)["errors"] += 1
+            logging.error(f"Cache invalidation error ({namespace}): {str(e)}")
+    
+    def metrics(self) -> Dict:
+        return {
+            "backend": self.backend.name,
+            "ttl_seconds": self.ttl_seconds,
+            "inflight_fills": len(self.inflight),
+            **self.backend.metrics(),
+            "namespaces": self.stats
+        }
+
+def create_cache_backend():
+    if CACHE_BACKEND == "redis":
+        if redis_asyncio is not None:
+            return RedisCacheBackend(redis_asyncio.from_url(REDIS_URL))
+        logging.error("CACHE_BACKEND=redis but the redis package is not installed; using the in-memory cache")
+    return MemoryCacheBackend(max_entries=CONTENT_CACHE_MAX_ENTRIES)
+
+content_cache = SharedCache(create_cache_backend(), ttl_seconds=CONTENT_CACHE_TTL_SECONDS)
+# Crawl results come from public tools, so they get their own small store and can't evict content
+crawl_cache = SharedCache(MemoryCacheBackend(max_entries=CRAWL_CACHE_MAX_ENTRIES), ttl_seconds=CRAWL_CACHE_TTL_SECONDS)
+
+# Cached namespaces whose documents carry coalesced counters
+COUNTER_CACHE_NAMESPACES = {"social_media_posts": "social", "lead_magnets": "lead_magnets"}
+
+async def invalidate_counter_caches(collection_names: List[str]):
+    """Drop cached content once flushed counters have landed in Mongo"""
+    for collection_name in collection_names:
+        if collection_name in COUNTER_CACHE_NAMESPACES:
+            await content_cache.invalidate(COUNTER_CACHE_NAMESPACES[collection_name])
+
+@api_router.get("/admin/cache/stats")
+async def get_cache_stats(_: None = Depends(verify_admin_key)):
+    """Get shared cache hit/miss statistics (PROTECTED)"""
+    return content_cache.metrics()
+
+# ============ COALESCED COUNTERS ============
+
+class CounterCoalescer:
+    """Sharded in-process accumulator for hot $inc counters.
+    
+    Increments are summed per (collection, id, field) without touching Mongo and
+    written as one bulk_write per collection every `flush_interval_ms`. Keys are
+    spread over `shards` dicts so each flush swaps out small maps instead of one
+    large one, and reads can add `pending()` deltas that have not landed yet.
+    """
+    
+    def __init__(self, shards: int = 16, flush_interval_ms: int = 1000, after_flush=None):
+        self.shards = [{} for _ in range(shards)]
+        # Optional coroutine called with the collections written by each flush
+        self.after_flush = after_flush
+        # Deltas swapped out of the shards but not yet acknowledged by Mongo
+        self.in_flight = {}
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_lock = asyncio.Lock()
+        # Set by stop(); the loop exits between flushes instead of being cancelled mid-write
+        self.stopping = asyncio.Event()
+        self.task = None
+        self.stats = {
+            "increments": 0,
+            "documents_written": 0,
+            "write_errors": 0,
+            "flushes": 0,
+            "last_flush_at": None
+        }
+    
+    def increment(self, collection_name: str, doc_id: str, field: str, amount: int = 1):
+        key = (collection_name, doc_id, field)
+        shard = self.shards[hash(key) % len(self.shards)]
+        shard[key] = shard.get(key, 0) + amount
+        self.stats["increments"] += 1
+    
+    def pending(self, collection_name: str, doc_id: str, field: str) -> int:
+        """Delta for one counter that has not been written yet"""
+        key = (collection_name, doc_id, field)
+        return self.shards[hash(key) % len(self.shards)].get(key, 0) + self.in_flight.get(key, 0)
+    
+    def apply_pending(self, collection_name: str, docs: List[Dict], fields: List[str]) -> List[Dict]:
+        """Add unwritten deltas to counters of documents read from Mongo"""
+        for doc in docs:
+            for field in fields:
+                delta = self.pending(collection_name, doc.get("id"), field)
+                if delta:
+                    doc[field] = (doc.get(field) or 0) + delta
+        return docs
+    
+    async def flush(self):
+        """Swap out every shard and write the summed deltas, one bulk_write per collection"""
+        async with self.flush_lock:
+            for index, shard in enumerate(self.shards):
+                if shard:
+                    self.shards[index] = {}
+                    for key, amount in shard.items():
+                        self.in_flight[key] = self.in_flight.get(key, 0) + amount
+            if not self.in_flight:
+                return
+            
+            updates = {}
+            for (collection_name, doc_id, field), amount in self.in_flight.items():
+                updates.setdefault(collection_name, {}).setdefault(doc_id, {})[field] = amount
+            for collection_name, docs in updates.items():
+                doc_ids = list(docs)
+                failed = set()
+                try:
+                    await db[collection_name].bulk_write([
+                        UpdateOne({"id": doc_id}, {"$inc": docs[doc_id]}) for doc_id in doc_ids
+                    ], ordered=False)
+                except BulkWriteError as e:
+                    # Unordered: every update not listed in writeErrors was applied
+                    failed = {doc_ids[error["index"]] for error in e.details.get("writeErrors", [])}
+                    self.stats["write_errors"] += len(failed)
+                    logging.error(f"Counter flush error ({collection_name}): {len(failed)} of {len(doc_ids)} updates failed")
+                except Exception as e:
+                    # Nothing acknowledged; keep the deltas in flight so the next flush retries them
+                    self.stats["write_errors"] += len(docs)
+                    logging.error(f"Counter flush error ({collection_name}): {str(e)}")
+                    continue
+                # Drop acknowledged deltas before anything else awaits, so no read adds
+                # them on top of a Mongo value that already includes them
+                for doc_id in doc_ids:
+                    if doc_id not in failed:
+                        for field in docs[doc_id]:
+                            del self.in_flight[(collection_name, doc_id, field)]
+                self.stats["documents_written"] += len(doc_ids) - len(failed)
+                if self.after_flush and len(failed) < len(doc_ids):
+                    try:
+                        await self.after_flush([collection_name])
+                    except Exception as e:
+                        logging.error(f"Counter after_flush error ({collection_name}): {str(e)}")
+            self.stats["flushes"] += 1
+            self.stats["last_flush_at"] = datetime.now(timezone.utc)
+    
+    async def run(self):
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            # Shielded: a cancelled bulk_write may still land, and a retry would apply it twice
+            await asyncio.shield(self.flush())
+    
+    def start(self):
+        if self.task is None:
+            self.stopping.clear()
+            self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        """Stop the flush loop after its current flush and write whatever is still pending"""
+        if self.task is not None:
+            self.stopping.set()
+            await self.task
+            self.task = None
+        await asyncio.shield(self.flush())
+    
+    def metrics(self) -> Dict:
+        return {
+            "pending_counters": sum(len(shard) for shard in self.shards),
+            "in_flight_counters": len(self.in_flight),
+            **self.stats
+        }
+
+counter_coalescer = CounterCoalescer(after_flush=invalidate_counter_caches)
+
+# ============ PAGE VIEW BUCKETS ============
+
+# Hourly per-page counters maintained on ingest, so analytics read a few
+# bucket documents instead of grouping the whole raw page_views collection
+def hour_bucket(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+async def update_page_view_buckets(views: List[Dict]):
+    """$inc the hourly bucket of every page in a batch of raw page views"""
+    counts = {}
+    for view in views:
+        key = (view["page"], hour_bucket(view["timestamp"]))
+        counts[key] = counts.get(key, 0) + 1
+    operations = [
+        UpdateOne({"page": page, "hour": hour}, {"$inc": {"count": count}}, upsert=True)
+        for (page, hour), count in counts.items()
+    ]
+    if operations:
+        await db.page_view_buckets.bulk_write(operations, ordered=False)
+
+# ============ UNIQUE VISITOR SKETCHES ============
+
+class HyperLogLog:
+    """Fixed-size cardinality sketch (2^precision one-byte registers).
+    
+    With the default precision of 12 a sketch is 4 KB and estimates distinct
+    counts within about 1.6%, whatever the traffic. Sketches merge by taking
+    the register-wise maximum, so per-day sketches combine into any range.
+    Registers are a numpy uint8 array so merge and count run vectorized.
+    """
+    
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers:
+            self.registers = np.frombuffer(registers, dtype=np.uint8).copy()
+        else:
+            self.registers = np.zeros(self.size, dtype=np.uint8)
+    
+    def add(self, value: str):
+        hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        index = hashed >> (64 - self.precision)
+        remainder = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+    
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / float(np.ldexp(1.0, -self.registers.astype(np.int32)).sum())
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+    
+    def to_binary(self) -> Binary:
+        return Binary(self.registers.tobytes())
+
+SKETCH_MERGE_RETRIES = 5
+
+# Page value of the site-wide daily sketch, so the total is one sketch per day
+# instead of a merge of every page's sketch
+SITE_SKETCH_PAGE = "*"
+
+# Where the unique visitor estimate comes from, reported next to it
+UNIQUE_VISITOR_BASIS = (
+    "Distinct session_id values from page views and tracking events (bots excluded). "
+    "Hits without a session_id, including every /tracking/pixel.gif hit, are not counted."
+)
+
+async def merge_visitor_sketch(page: str, day: datetime, sketch: HyperLogLog):
+    """Merge a sketch into the stored (page, day) sketch with optimistic concurrency"""
+    for _ in range(SKETCH_MERGE_RETRIES):
+        stored = await db.visitor_sketches.find_one({"page": page, "day": day}, {"registers": 1, "version": 1})
+        if not stored:
+            try:
+                await db.visitor_sketches.insert_one({"page": page, "day": day, "registers": sketch.to_binary(), "version": 1})
+                return
+            except DuplicateKeyError:
+                continue
+        merged = HyperLogLog(sketch.precision, stored["registers"]).merge(sketch)
+        if merged.registers.tobytes() == bytes(stored["registers"]):
+            return
+        result = await db.visitor_sketches.update_one(
+            {"_id": stored["_id"], "version": stored["version"]},
+            {"$set": {"registers": merged.to_binary()}, "$inc": {"version": 1}}
+        )
+        if result.modified_count:
+            return
+    logging.warning(f"Visitor sketch merge for {page} gave up after {SKETCH_MERGE_RETRIES} conflicts")
+
+def sketch_day(timestamp: datetime) -> datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+async def update_visitor_sketches(views: List[Dict], per_page: bool = True):
+    """Add the session of every hit in a batch to the site-wide daily sketch,
+    and to its page's daily sketch when `per_page` is set"""
+    sketches = {}
+    for view in views:
+        if not view.get("session_id") or view.get("is_bot"):
+            continue
+        day = sketch_day(view["timestamp"])
+        sketches.setdefault((SITE_SKETCH_PAGE, day), HyperLogLog()).add(view["session_id"])
+        if per_page and view.get("page"):
+            sketches.setdefault((view["page"], day), HyperLogLog()).add(view["session_id"])
+    await asyncio.gather(*(merge_visitor_sketch(page, day, sketch) for (page, day), sketch in sketches.items()))
+
+async def estimate_unique_visitors(since: datetime, until: Optional[datetime] = None, pages: Optional[List[str]] = None) -> Dict:
+    """Site-wide unique visitors for a range, plus per-page estimates for `pages`.
+    
+    The total merges one site-wide sketch per day. Days recorded before the
+    site-wide sketch existed fall back to merging that day's page sketches.
+    """
+    day_range = {"$gte": sketch_day(since)}
+    if until:
+        day_range["$lt"] = until
+    
+    overall = HyperLogLog()
+    site_days = set()
+    async for stored in db.visitor_sketches.find({"page": SITE_SKETCH_PAGE, "day": day_range}, {"_id": 0, "day": 1, "registers": 1}):
+        overall.merge(HyperLogLog(registers=stored["registers"]))
+        site_days.add(stored["day"])
+    legacy_days = [day for day in await db.visitor_sketches.distinct("day", {"day": day_range}) if day not in site_days]
+    if legacy_days:
+        async for stored in db.visitor_sketches.find({"day": {"$in": legacy_days}}, {"_id": 0, "registers": 1}):
+            overall.merge(HyperLogLog(registers=stored["registers"]))
+    
+    by_page = {}
+    if pages:
+        async for stored in db.visitor_sketches.find({"page": {"$in": pages}, "day": day_range}, {"_id": 0, "page": 1, "registers": 1}):
+            sketch = HyperLogLog(registers=stored["registers"])
+            if stored["page"] in by_page:
+                by_page[stored["page"]].merge(sketch)
+            else:
+                by_page[stored["page"]] = sketch
+    return {
+        "total": overall.count(),
+        "by_page": {page: sketch.count() for page, sketch in by_page.items()}
+    }
+
+async def ingest_page_views(views: List[Dict]):
+    """Update every pre-aggregate derived from raw page views"""
+    await asyncio.gather(update_page_view_buckets(views), update_visitor_sketches(views))
+
+async def ingest_tracking_events(events: List[Dict]):
+    """Count the sessions behind tracking events towards site-wide unique visitors"""
+    await update_visitor_sketches(events, per_page=False)
+
+# ============ SESSIONIZATION & FUNNEL ============
+
+# Events of one session_id separated by more than this start a new session
+SESSION_INACTIVITY_TIMEOUT = timedelta(minutes=30)
+# Only events older than this are sessionized, so buffered writes have landed
+SESSIONIZER_LAG = timedelta(minutes=5)
+SESSIONIZER_BATCH_SIZE = 5000
+SESSIONIZER_MAX_BATCHES = 20
+# The lease is renewed after every batch; a worker that dies loses it after this long
+SESSIONIZER_LEASE = timedelta(minutes=2)
+SESSIONIZER_INTERVAL_SECONDS = 60
+
+# Lead funnel: a session reaches step N only after reaching steps 0..N-1 in order
+FUNNEL_STEPS = [
+    {"name": "quote_form", "pages": ["/get-quote"]},
+    {"name": "thank_you", "pages": ["/get-quote/thank-you", "/thank-you"]},
+    {"name": "checkout", "events": ["checkout_started", "begin_checkout"]},
+]
+
+def match_funnel_step(event: Dict) -> Optional[int]:
+    """Index of the funnel step an event represents, if any"""
+    for index, step in enumerate(FUNNEL_STEPS):
+        if event.get("kind") == "page_view" and event.get("page") in step.get("pages", []):
+            return index
+        if event.get("kind") == "event" and event.get("event_name") in step.get("events", []):
+            return index
+    return None
+
+def event_order_key(event: Dict) -> tuple:
+    """Sessionizer order: server timestamp, then position in the beacon, then id.
+    
+    Events stored before seq existed sort first within their millisecond, as in Mongo.
+    """
+    seq = event.get("seq")
+    return (event["timestamp"], -1 if seq is None else seq, event["id"])
+
+def apply_event_to_session(session: Optional[Dict], event: Dict) -> Dict:
+    """Advance a session summary by one event, opening a new session after inactivity"""
+    timestamp = event["timestamp"]
+    if session is None or timestamp - session["last_seen"] > SESSION_INACTIVITY_TIMEOUT:
+        session = {
+            "session_key": f"{event['session_id']}:{int(timestamp.timestamp() * 1000)}",
+            "session_id": event["session_id"],
+            "started_at": timestamp,
+            "last_seen": timestamp,
+            "event_count": 0,
+            "page_views": 0,
+            "landing_page": event.get("page"),
+            "funnel_progress": -1
+        }
+    session["last_seen"] = timestamp
+    session["event_count"] += 1
+    if event.get("kind") == "page_view":
+        session["page_views"] += 1
+    step = match_funnel_step(event)
+    if step is not None and step == session["funnel_progress"] + 1:
+        session["funnel_progress"] = step
+    session["last_event"] = {"timestamp": timestamp, "seq": event.get("seq"), "id": event["id"]}
+    return session
+
+async def sessionize_batch(after: Optional[Dict], cutoff: datetime) -> tuple:
+    """Fold the next batch of events after the watermark into session summaries.
+    
+    Returns (new watermark, number of events processed).
+    """
+    time_range = {"$lte": cutoff}
+    match = {"timestamp": time_range, "session_id": {"$type": "string"}, "is_bot": {"$ne": True}}
+    if after:
+        time_range["$gte"] = after["timestamp"]
+        seq = after.get("seq")
+        match["$or"] = [
+            {"timestamp": {"$gt": after["timestamp"]}},
+            # A missing seq sorts before every number, like null in the index
+            {"timestamp": after["timestamp"], "seq": {"$gt": seq} if seq is not None else {"$ne": None}},
+            {"timestamp": after["timestamp"], "seq": seq, "id": {"$gt": after["id"]}}
+        ]
+    order = {"timestamp": 1, "seq": 1, "id": 1}
+    projection = {"_id": 0, "id": 1, "session_id": 1, "timestamp": 1, "seq": 1, "page": 1, "event_name": 1}
+    # Each branch walks its (timestamp, seq, id) index and stops at one batch, so the
+    # outer sort merges at most two batches instead of everything past the watermark
+    events = await db.page_views.aggregate([
+        {"$match": match},
+        {"$sort": order},
+        {"$limit": SESSIONIZER_BATCH_SIZE},
+        {"$project": {**projection, "kind": "page_view"}},
+        {"$unionWith": {"coll": "tracking_events", "pipeline": [
+            {"$match": match},
+            {"$sort": order},
+            {"$limit": SESSIONIZER_BATCH_SIZE},
+            {"$project": {**projection, "kind": "event"}}
+        ]}},
+        {"$sort": order},
+        {"$limit": SESSIONIZER_BATCH_SIZE}
+    ]).to_list(SESSIONIZER_BATCH_SIZE)
+    if not events:
+        return after, 0
+    
+    # Latest stored session per session_id that could still be extended
+    session_ids = list({event["session_id"] for event in events})
+    open_since = events[0]["timestamp"] - SESSION_INACTIVITY_TIMEOUT
+    sessions = {}
+    async for stored in db.sessions.find(
+        {"session_id": {"$in": session_ids}, "last_seen": {"$gte": open_since}}, {"_id": 0}
+    ).sort("last_seen", ASCENDING):
+        sessions[stored["session_id"]] = stored
+    
+    touched = {}
+    for event in events:
+        session = sessions.get(event["session_id"])
+        last_event = (session or {}).get("last_event")
+        # Skip events already folded in by a run that died before saving its watermark
+        if last_event and event_order_key(event) <= event_order_key(last_event):
+            continue
+        session = apply_event_to_session(session, event)
+        sessions[event["session_id"]] = session
+        touched[session["session_key"]] = session
+    
+    if touched:
+        await db.sessions.bulk_write([
+            UpdateOne({"session_key": key}, {"$set": session}, upsert=True)
+            for key, session in touched.items()
+        ], ordered=False)
+    return {"timestamp": events[-1]["timestamp"], "seq": events[-1].get("seq"), "id": events[-1]["id"]}, len(events)
+
+async def run_sessionizer() -> int:
+    """Incrementally sessionize events since the stored watermark.
+    
+    A lease on the state document keeps concurrent workers from running it twice.
+    The lease is renewed with every watermark update, and both only apply while
+    this run still owns it. Returns the number of events processed.
+    """
+    now = datetime.now(timezone.utc)
+    owner = str(uuid.uuid4())
+    lease = await db.analytics_state.find_one_and_update(
+        {"id": "sessionizer", "$or": [{"locked_until": {"$lt": now}}, {"locked_until": {"$exists": False}}]},
+        {"$set": {"locked_until": now + SESSIONIZER_LEASE, "owner": owner}},
+        upsert=False,
+        return_document=ReturnDocument.AFTER
+    )
+    if lease is None:
+        lease = {"id": "sessionizer", "watermark": None, "owner": owner, "locked_until": now + SESSIONIZER_LEASE}
+        try:
+            await db.analytics_state.insert_one(lease)
+        except DuplicateKeyError:
+            return 0  # Another worker holds the lease
+    
+    watermark = lease.get("watermark")
+    cutoff = now - SESSIONIZER_LAG
+    processed = 0
+    try:
+        for _ in range(SESSIONIZER_MAX_BATCHES):
+            watermark, count = await sessionize_batch(watermark, cutoff)
+            processed += count
+            result = await db.analytics_state.update_one(
+                {"id": "sessionizer", "owner": owner},
+                {"$set": {"watermark": watermark, "locked_until": datetime.now(timezone.utc) + SESSIONIZER_LEASE}}
+            )
+            if not result.matched_count:
+                # The lease expired and another worker took over; its watermark wins
+                logging.warning("Sessionizer lease lost; stopping this run")
+                break
+            if count < SESSIONIZER_BATCH_SIZE:
+                break
+    finally:
+        await db.analytics_state.update_one(
+            {"id": "sessionizer", "owner": owner},
+            {"$set": {"locked_until": datetime.now(timezone.utc)}}
+        )
+    return processed
+
+class SessionizerLoop:
+    """Background catch-up for the sessionizer, so funnel reads never run it inline.
+    
+    Every worker runs the loop; the lease in run_sessionizer() lets one of them
+    do the work each round. A run that hits SESSIONIZER_MAX_BATCHES goes again
+    without waiting, until the backlog is drained.
+    """
+    
+    def __init__(self, interval_seconds: float = SESSIONIZER_INTERVAL_SECONDS):
+        self.interval = interval_seconds
+        self.task = None
+        self.stats = {"runs": 0, "events_processed": 0, "errors": 0, "last_run_at": None}
+    
+    async def run(self):
+        while True:
+            processed = 0
+            try:
+                processed = await run_sessionizer()
+                self.stats["runs"] += 1
+                self.stats["events_processed"] += processed
+                self.stats["last_run_at"] = datetime.now(timezone.utc)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.error(f"Sessionizer error: {str(e)}")
+            if processed < SESSIONIZER_BATCH_SIZE * SESSIONIZER_MAX_BATCHES:
+                await asyncio.sleep(self.interval)
+    
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+    
+    def metrics(self) -> Dict:
+        return dict(self.stats)
+
+sessionizer_loop = SessionizerLoop()
+
+@api_router.get("/analytics/funnel")
+async def get_funnel(since: Optional[datetime] = None, until: Optional[datetime] = None, _: None = Depends(verify_admin_key)):
+    """Step-by-step conversion of the lead funnel from session summaries (PROTECTED)"""
+    try:
+        # Session summaries are kept current by sessionizer_loop in the background
+        state = await db.analytics_state.find_one({"id": "sessionizer"}, {"_id": 0, "watermark": 1})
+        watermark = (state or {}).get("watermark")
+        
+        started = {}
+        if since:
+            started["$gte"] = as_utc(since)
+        if until:
+            started["$lt"] = as_utc(until)
+        pipeline = [{"$match": {"started_at": started}}] if started else []
+        pipeline.append({"$group": {"_id": "$funnel_progress", "sessions": {"$sum": 1}}})
+        buckets = {bucket["_id"]: bucket["sessions"] async for bucket in db.sessions.aggregate(pipeline)}
+        
+        total_sessions = sum(buckets.values())
+        steps = []
+        for index, step in enumerate(FUNNEL_STEPS):
+            reached = sum(count for progress, count in buckets.items() if progress is not None and progress >= index)
+            previous = steps[-1]["sessions"] if steps else total_sessions
+            steps.append({
+                "step": step["name"],
+                "sessions": reached,
+                "step_conversion_rate": round(reached / previous * 100, 1) if previous else 0
+            })
+        
+        first = steps[0]["sessions"] if steps else 0
+        return {
+            "total_sessions": total_sessions,
+            "steps": steps,
+            "overall_conversion_rate": round(steps[-1]["sessions"] / first * 100, 1) if first else 0,
+            "sessionized_through": watermark["timestamp"].isoformat() if watermark else None,
+            "inactivity_timeout_minutes": int(SESSION_INACTIVITY_TIMEOUT.total_seconds() // 60)
+        }
+    except Exception as e:
+        logging.error(f"Funnel analytics error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get funnel analytics")
+
+page_view_backfill_status = {
+    "running": False,
+    "started_at": None,
+    "finished_at": None,
+    "rebuilt_before": None,
+    "error": None
+}
+
+# Hours that ended longer ago than this are closed: buffered views for them have
+# flushed, so live rollups no longer touch their buckets
+PAGE_VIEW_BACKFILL_LAG = timedelta(minutes=5)
+
+async def backfill_page_view_buckets():
+    """Background job: rebuild closed hourly buckets from the raw page_views collection.
+    
+    Runs entirely server-side ($dateTrunc + $merge), replacing the count of every
+    bucket it computes. Only closed hours are rebuilt, so the replace never races
+    the live $inc rollups, and bot-tagged views are left out as they are live.
+    Raw views still stored with string timestamps are skipped, so run the
+    datetime migration first.
+    """
+    status = page_view_backfill_status
+    status.update({"running": True, "started_at": datetime.now(timezone.utc), "finished_at": None, "error": None})
+    try:
+        closed_before = hour_bucket(datetime.now(timezone.utc) - PAGE_VIEW_BACKFILL_LAG)
+        status["rebuilt_before"] = closed_before
+        await db.page_views.aggregate([
+            {"$match": {"timestamp": {"$type": "date", "$lt": closed_before}, "page": {"$type": "string"}, "is_bot": {"$ne": True}}},
+            {"$group": {
+                "_id": {"page": "$page", "hour": {"$dateTrunc": {"date": "$timestamp", "unit": "hour"}}},
+                "count": {"$sum": 1}
+            }},
+            {"$project": {"_id": 0, "page": "$_id.page", "hour": "$_id.hour", "count": 1}},
+            {"$merge": {"into": "page_view_buckets", "on": ["page", "hour"], "whenMatched": "merge", "whenNotMatched": "insert"}}
+        ]).to_list(None)
+        logging.info("Page view buckets backfilled")
+    except Exception as e:
+        status["error"] = str(e)
+        logging.error(f"Page view bucket backfill error: {str(e)}")
+    finally:
+        status["running"] = False
+        status["finished_at"] = datetime.now(timezone.utc)
+
+@api_router.post("/admin/analytics/backfill-buckets")
+async def start_page_view_backfill(background_tasks: BackgroundTasks, _: None = Depends(verify_admin_key)):
+    """Rebuild hourly page view buckets from raw views (PROTECTED)"""
+    if page_view_backfill_status["running"]:
+        return {"started": False, "message": "Backfill already running", "status": page_view_backfill_status}
+    background_tasks.add_task(backfill_page_view_buckets)
+    return {"started": True, "message": "Backfill started"}
+
+@api_router.get("/admin/analytics/backfill-buckets")
+async def get_page_view_backfill_status(_: None = Depends(verify_admin_key)):
+    """Get status of the page view bucket backfill (PROTECTED)"""
+    return page_view_backfill_status
+
+tracking_event_buffer = WriteBehindBuffer("tracking_events", after_flush=ingest_tracking_events)
+page_view_buffer = WriteBehindBuffer("page_views", after_flush=ingest_page_views)
+WRITE_BEHIND_BUFFERS = [tracking_event_buffer, page_view_buffer]
+
+# ============ BOT FILTERING ============
+
+# Signatures of crawlers, uptime probes, link previewers and HTTP libraries
+BOT_USER_AGENT_SIGNATURES = [
+    # Generic "...bot/1.0" and "(+http://...)" tokens; a bare "bot" must start a word,
+    # so device names such as "CUBOT X19" stay human
+    r"bot/", r"(?<![a-z])bot\b", r"\+https?://", r"crawl", r"spider", r"slurp", r"scrap", r"archiver", r"fetcher",
+    r"headless", r"phantomjs", r"selenium", r"puppeteer", r"playwright", r"lighthouse",
+    r"pingdom", r"uptimerobot", r"statuscake", r"site24x7", r"newrelicpinger", r"datadog",
+    r"facebookexternalhit", r"facebot", r"twitterbot", r"slackbot", r"slack-imgproxy",
+    r"discordbot", r"telegrambot", r"whatsapp", r"linkedinbot", r"skypeuripreview",
+    r"embedly", r"quora link preview", r"redditbot", r"vkshare",
+    r"googleimageproxy", r"google-read-aloud", r"feedfetcher", r"mediapartners-google",
+    r"bingpreview", r"baiduspider", r"petalbot", r"semrush",
+    r"ahrefs", r"mj12", r"dotbot", r"bytespider", r"gptbot", r"ccbot", r"claudebot",
+    r"curl/", r"wget/", r"python-requests", r"python-urllib", r"aiohttp", r"httpx",
+    r"go-http-client", r"java/", r"okhttp", r"libwww-perl", r"node-fetch", r"axios/",
+]
+# One alternation compiled once, so classifying a hit is a single regex scan
+BOT_USER_AGENT_RE = re.compile("|".join(BOT_USER_AGENT_SIGNATURES), re.IGNORECASE)
+BOT_VERDICT_CACHE_SIZE = 4096
+# "drop" skips bot hits entirely; "tag" stores them with is_bot so they can be audited
+BOT_TRAFFIC_MODE = os.environ.get("BOT_TRAFFIC_MODE", "drop").lower()
+
+# Mail providers fetch pixels through these on behalf of the person opening the email
+EMAIL_IMAGE_PROXY_RE = re.compile(r"googleimageproxy|yahoomailproxy|ymailproxy", re.IGNORECASE)
+# Link previewers are bots, but a pixel they fetch is kept (tagged) so shares stay auditable
+LINK_PREVIEW_RE = re.compile(r"whatsapp|telegrambot|discordbot|slackbot|slack-imgproxy|skypeuripreview", re.IGNORECASE)
+
+bot_filter_stats = {"hits": 0, "bots": 0, "image_proxy_hits": 0}
+
+@lru_cache(maxsize=BOT_VERDICT_CACHE_SIZE)
+def is_bot_user_agent(user_agent: Optional[str]) -> bool:
+    """Classify a user-agent string; a missing user-agent counts as a bot"""
+    if not user_agent:
+        return True
+    return BOT_USER_AGENT_RE.search(user_agent) is not None
+
+def filter_bot_hit(request: Request, pixel: bool = False) -> tuple:
+    """Classify a tracking hit. Returns (is_bot, keep) per BOT_TRAFFIC_MODE.
+    
+    For the email pixel, mail image proxies count as the human who opened the
+    email, and link previewers are tagged instead of dropped.
+    """
+    user_agent = request.headers.get("user-agent")
+    bot_filter_stats["hits"] += 1
+    if pixel and user_agent and EMAIL_IMAGE_PROXY_RE.search(user_agent):
+        bot_filter_stats["image_proxy_hits"] += 1
+        return False, True
+    is_bot = is_bot_user_agent(user_agent)
+    if is_bot:
+        bot_filter_stats["bots"] += 1
+    if pixel and is_bot and LINK_PREVIEW_RE.search(user_agent):
+        return True, True
+    return is_bot, not (is_bot and BOT_TRAFFIC_MODE == "drop")
+
+@api_router.get("/admin/metrics")
+async def get_metrics(_: None = Depends(verify_admin_key)):
+    """Get in-process performance metrics (PROTECTED)"""
+    return {
+        "write_buffers": {buffer.collection_name: buffer.metrics() for buffer in WRITE_BEHIND_BUFFERS},
+        "counters": counter_coalescer.metrics(),
+        "content_cache": content_cache.metrics(),
+        "crawl_cache": crawl_cache.metrics(),
+        "sessionizer": sessionizer_loop.metrics(),
+        "index_fallbacks": index_fallbacks_in_use,
+        "compression": {
+            **compression_stats,
+            "bytes_saved": compression_stats["bytes_in"] - compression_stats["bytes_out"],
+            "brotli_available": brotli is not None
+        },
+        "pricing_tables": {
+            "fingerprint": pricing_tables["fingerprint"],
+            "quotes": len(pricing_tables["quotes"]),
+            "built_at": pricing_tables["built_at"]
+        },
+        "bot_filter": {
+            **bot_filter_stats,
+            "mode": BOT_TRAFFIC_MODE,
+            "verdict_cache": is_bot_user_agent.cache_info()._asdict()
+        }
+    }
+
 # ============ WEBHOOKS & TRACKING ============
 
 class WebhookEvent(BaseModel):
@@ -2501,6 +4327,16 @@ class WebhookEvent(BaseModel):
     event_data: Dict[str, Any]
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class TrackingEventIn(BaseModel):
+    event_name: str
+    event_data: Dict[str, Any] = {}
+    session_id: Optional[str] = None
+    page: Optional[str] = None
+    referrer: Optional[str] = None
+    client_timestamp: Optional[datetime] = None
+
+TRACKING_BATCH_MAX_EVENTS = 500
+
 @api_router.post("/webhooks/receive")
 async def receive_webhook(event: WebhookEvent):
     """Generic webhook receiver for external integrations"""
@@ -2509,7 +4345,7 @@ async def receive_webhook(event: WebhookEvent):
             "id": str(uuid.uuid4()),
             "event_type": event.event_type,
             "event_data": event.event_data,
-            "timestamp": event.timestamp.isoformat(),
+            "timestamp": event.timestamp,
             "processed": False
         }
         await db.webhook_logs.insert_one(webhook_log)
@@ -2537,26 +4373,109 @@ async def track_event(event_name: str, event_data: Optional[Dict] = None, sessio
             "event_name": event_name,
             "event_data": event_data or {},
             "session_id": session_id,
-            "timestamp": datetime.now(timezone.utc).isoformat()
+            "timestamp": datetime.now(timezone.utc),
+            "seq": 0
         }
-        await db.tracking_events.insert_one(tracking_event)
-        return {"success": True}
+        return {"success": tracking_event_buffer.enqueue(tracking_event)}
     except Exception as e:
         logging.error(f"Tracking error: {str(e)}")
         return {"success": False}
 
+@api_router.post("/tracking/batch")
+async def track_event_batch(request: Request):
+    """Track a batch of client-side events in one request.
+    
+    Accepts a JSON array (or {"events": [...]}) sent as application/json or as the
+    text/plain body navigator.sendBeacon produces. Page views go to page_views,
+    everything else to tracking_events, each in a single insert_many.
+    """
+    try:
+        payload = json.loads(await request.body() or b"[]")
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if isinstance(payload, dict):
+        payload = payload.get("events", [])
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of events")
+    if len(payload) > TRACKING_BATCH_MAX_EVENTS:
+        raise HTTPException(status_code=413, detail=f"Batch limited to {TRACKING_BATCH_MAX_EVENTS} events")
+    
+    is_bot, keep = filter_bot_hit(request)
+    if not keep:
+        return {"success": True, "accepted": 0, "rejected": 0, "filtered": len(payload)}
+    
+    now = datetime.now(timezone.utc)
+    tracking_events = []
+    page_views = []
+    rejected = 0
+    # seq is the position in the beacon: every event shares `now`, so it is what keeps
+    # a page view ahead of the checkout click that followed it
+    for seq, item in enumerate(payload):
+        try:
+            event = TrackingEventIn(**item)
+        except (ValidationError, TypeError):
+            rejected += 1
+            continue
+        if event.event_name == "page_view" and event.page:
+            page_views.append({
+                "id": str(uuid.uuid4()),
+                "page": event.page,
+                "referrer": event.referrer,
+                "session_id": event.session_id,
+                "timestamp": now,
+                "seq": seq,
+                "user_agent": request.headers.get("user-agent", ""),
+                "is_bot": is_bot
+            })
+        else:
+            tracking_events.append({
+                "id": str(uuid.uuid4()),
+                "event_name": event.event_name,
+                "event_data": event.event_data,
+                "session_id": event.session_id,
+                "page": event.page,
+                "referrer": event.referrer,
+                "client_timestamp": event.client_timestamp,
+                "timestamp": now,
+                "seq": seq,
+                "is_bot": is_bot
+            })
+    
+    try:
+        writes = []
+        if tracking_events:
+            writes.append(db.tracking_events.insert_many(tracking_events, ordered=False))
+        if page_views:
+            writes.append(db.page_views.insert_many(page_views, ordered=False))
+            # Tagged bot views are kept for auditing but stay out of the rollups
+            if not is_bot:
+                writes.append(ingest_page_views(page_views))
+        if tracking_events and not is_bot:
+            writes.append(ingest_tracking_events(tracking_events))
+        await asyncio.gather(*writes)
+    except Exception as e:
+        logging.error(f"Batch tracking error: {str(e)}")
+        return {"success": False, "accepted": 0, "rejected": len(payload)}
+    
+    return {"success": True, "accepted": len(tracking_events) + len(page_views), "rejected": rejected}
+
 @api_router.get("/tracking/pixel.gif")
 async def tracking_pixel(request: Request, event: str = "pageview", ref: Optional[str] = None):
     """1x1 tracking pixel for email opens, etc."""
     try:
-        tracking_event = {
-            "id": str(uuid.uuid4()),
-            "event_name": event,
-            "referrer": ref,
-            "user_agent": request.headers.get("user-agent"),
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        await db.tracking_events.insert_one(tracking_event)
+        is_bot, keep = filter_bot_hit(request, pixel=True)
+        if keep:
+            tracking_event = {
+                "id": str(uuid.uuid4()),
+                "event_name": event,
+                "referrer": ref,
+                "user_agent": request.headers.get("user-agent"),
+                "timestamp": datetime.now(timezone.utc),
+                "seq": 0,
+                "is_bot": is_bot
+            }
+            # Enqueue only; the pixel is returned without waiting on Mongo
+            tracking_event_buffer.enqueue(tracking_event)
     except Exception as e:
         logging.error(f"Pixel tracking error: {str(e)}")
     
@@ -2568,7 +4487,9 @@ async def tracking_pixel(request: Request, event: str = "pageview", ref: Optiona
 @api_router.get("/site-settings")
 async def get_site_settings():
     """Get site settings including SEO and tracking IDs"""
-    settings = await db.site_settings.find_one({"id": "main"}, {"_id": 0})
+    settings = await content_cache.get_or_load(
+        "site_settings", ("main",), lambda: db.site_settings.find_one({"id": "main"}, {"_id": 0})
+    )
     if not settings:
         settings = {
             "id": "main",
@@ -2595,11 +4516,599 @@ async def update_site_settings(settings: Dict[str, Any]):
             {"$set": settings},
             upsert=True
         )
+        await content_cache.invalidate("site_settings")
         return {"success": True, "message": "Settings updated"}
     except Exception as e:
         logging.error(f"Update settings error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to update settings")
 
+# ============ DATABASE INDEXES ============
+
+# Index registry: every hot lookup filters on our own `id`/`email`/`slug` fields
+# rather than `_id`, so each one needs a backing index. Applied on startup;
+# create_indexes is a no-op for indexes that already exist with the same spec.
+INDEX_REGISTRY = {
+    "leads": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Emails are stored normalized (trimmed, lowercased) by upsert_lead
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # Compound keys end in (timestamp, id) to serve keyset pagination
+        IndexModel([("status", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="status_timestamp_id"),
+        IndexModel([("lead_source", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="source_timestamp_id"),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+    ],
+    "lead_activities": [
+        IndexModel([("lead_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="lead_timestamp_id"),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+    ],
+    "payment_transactions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("session_id", ASCENDING)], name="session_id"),
+        IndexModel([("payment_status", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="payment_status_timestamp_id"),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+    ],
+    "blog_posts": [
+        IndexModel([("slug", ASCENDING)], name="slug"),
+        IndexModel([("published", ASCENDING), ("timestamp", DESCENDING)], name="published_timestamp"),
+    ],
+    "social_media_posts": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("published", ASCENDING), ("featured", ASCENDING), ("timestamp", DESCENDING)], name="published_featured_timestamp"),
+    ],
+    "lead_magnets": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "newsletter_subscriptions": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "affiliate_links": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "site_settings": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "page_view_buckets": [
+        # Also the $merge key of the bucket backfill, which requires it to be unique
+        IndexModel([("page", ASCENDING), ("hour", ASCENDING)], name="page_hour_unique", unique=True),
+        IndexModel([("hour", ASCENDING)], name="hour"),
+    ],
+    # (timestamp, seq, id) is the sessionizer's event order; seq keeps beacon order within a millisecond
+    "page_views": [
+        IndexModel([("timestamp", ASCENDING), ("seq", ASCENDING), ("id", ASCENDING)], name="timestamp_seq_id"),
+    ],
+    "tracking_events": [
+        IndexModel([("timestamp", ASCENDING), ("seq", ASCENDING), ("id", ASCENDING)], name="timestamp_seq_id"),
+    ],
+    "sessions": [
+        IndexModel([("session_key", ASCENDING)], name="session_key_unique", unique=True),
+        IndexModel([("session_id", ASCENDING), ("last_seen", DESCENDING)], name="session_last_seen"),
+        IndexModel([("started_at", ASCENDING)], name="started_at"),
+    ],
+    "analytics_state": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "migrations": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "visitor_sketches": [
+        IndexModel([("page", ASCENDING), ("day", ASCENDING)], name="page_day_unique", unique=True),
+        IndexModel([("day", ASCENDING)], name="day"),
+    ],
+}
+
+# Canonical query shape for each hot route, used by the index advisor
+CANONICAL_QUERIES = [
+    {"route": "GET /leads/{lead_id}", "collection": "leads", "filter": {"id": ""}},
+    {"route": "PATCH /leads/{lead_id}", "collection": "leads", "filter": {"id": ""}},
+    {"route": "GET /leads", "collection": "leads", "filter": {"status": "new"}, "sort": {"timestamp": -1, "id": -1}},
+    {"route": "POST /newsletter/subscribe (lead lookup)", "collection": "leads", "filter": {"email": ""}},
+    {"route": "GET /checkout/status/{session_id}", "collection": "payment_transactions", "filter": {"session_id": ""}},
+    {"route": "GET /admin/payments", "collection": "payment_transactions", "filter": {"payment_status": "paid"}, "sort": {"timestamp": -1, "id": -1}},
+    {"route": "GET /admin/payments/{transaction_id}", "collection": "payment_transactions", "filter": {"id": ""}},
+    {"route": "GET /blog", "collection": "blog_posts", "filter": {"published": True}, "sort": {"timestamp": -1}},
+    {"route": "GET /blog/{slug}", "collection": "blog_posts", "filter": {"slug": "", "published": True}},
+    {"route": "GET /social/posts/{post_id}", "collection": "social_media_posts", "filter": {"id": "", "published": True}},
+    {"route": "GET /social/featured", "collection": "social_media_posts", "filter": {"published": True, "featured": True}, "sort": {"timestamp": -1}},
+    {"route": "POST /lead-magnets/{magnet_id}/download", "collection": "lead_magnets", "filter": {"id": "", "active": True}},
+    {"route": "POST /newsletter/subscribe", "collection": "newsletter_subscriptions", "filter": {"email": ""}},
+    {"route": "POST /affiliate/{link_id}/click", "collection": "affiliate_links", "filter": {"id": ""}},
+]
+
+# Indexes replaced by a registry entry on the same keys; dropped before the
+# replacement is created because MongoDB rejects two indexes on one key pattern
+SUPERSEDED_INDEXES = {
+    "leads": ["email", "status_timestamp", "source_timestamp", "timestamp"],
+    "lead_activities": ["lead_timestamp"],
+    "payment_transactions": ["payment_status_timestamp", "timestamp"],
+    "newsletter_subscriptions": ["email"],
+    "page_views": ["timestamp_id"],
+    "tracking_events": ["timestamp_id"],
+}
+
+# Non-unique fallbacks used when legacy duplicates block a unique index
+INDEX_FALLBACKS = {
+    ("leads", "email_unique"): IndexModel([("email", ASCENDING)], name="email"),
+    ("newsletter_subscriptions", "email_unique"): IndexModel([("email", ASCENDING)], name="email"),
+}
+
+# Unique indexes that could not be built and run on a non-unique fallback
+index_fallbacks_in_use = []
+
+async def ensure_indexes():
+    """Create all registered indexes (idempotent)"""
+    index_fallbacks_in_use.clear()
+    for collection_name, indexes in INDEX_REGISTRY.items():
+        collection = db[collection_name]
+        try:
+            existing = await collection.index_information()
+            for name in SUPERSEDED_INDEXES.get(collection_name, []):
+                if name in existing:
+                    await collection.drop_index(name)
+        except OperationFailure as e:
+            logging.error(f"Index cleanup failed for {collection_name}: {str(e)}")
+        
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                # Usually duplicate values blocking a unique index. Keep starting up,
+                # with a plain index on the same keys if there is one.
+                logging.error(f"Index {collection_name}.{name} creation failed: {str(e)}")
+                fallback = INDEX_FALLBACKS.get((collection_name, name))
+                if fallback:
+                    logging.critical(
+                        f"{collection_name}.{name} is NOT unique: duplicates remain, so writes keyed on it "
+                        f"are not deduplicated. Run POST /api/admin/migrations/emails, then restart."
+                    )
+                    index_fallbacks_in_use.append(f"{collection_name}.{name}")
+                    try:
+                        await collection.create_indexes([fallback])
+                    except OperationFailure as fallback_error:
+                        logging.error(f"Fallback index for {collection_name}.{name} failed: {str(fallback_error)}")
+    logging.info("Database indexes ensured")
+
+def collect_plan_stages(plan: Dict) -> List[str]:
+    """Flatten the stage names of an explain() winning plan"""
+    stages = []
+    if not isinstance(plan, dict):
+        return stages
+    if "stage" in plan:
+        stages.append(plan["stage"])
+    if "inputStage" in plan:
+        stages.extend(collect_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(collect_plan_stages(child))
+    return stages
+
+@api_router.get("/admin/indexes/advisor")
+async def index_advisor(_: None = Depends(verify_admin_key)):
+    """Explain each route's canonical query and report collection scans (PROTECTED)"""
+    try:
+        report = []
+        for query in CANONICAL_QUERIES:
+            find_command = {"find": query["collection"], "filter": query["filter"]}
+            if query.get("sort"):
+                find_command["sort"] = query["sort"]
+            explain = await db.command({"explain": find_command, "verbosity": "queryPlanner"})
+            winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+            # Slot-based engine nests the classic plan under "queryPlan"
+            winning_plan = winning_plan.get("queryPlan", winning_plan)
+            stages = collect_plan_stages(winning_plan)
+            report.append({
+                "route": query["route"],
+                "collection": query["collection"],
+                "stages": stages,
+                "collection_scan": "COLLSCAN" in stages,
+                "in_memory_sort": "SORT" in stages
+            })
+
+        existing = {}
+        for collection_name in INDEX_REGISTRY:
+            index_info = await db[collection_name].index_information()
+            existing[collection_name] = sorted(index_info.keys())
+
+        return {
+            "queries": report,
+            "collection_scans": sum(1 for r in report if r["collection_scan"]),
+            "indexes": existing
+        }
+    except Exception as e:
+        logging.error(f"Index advisor error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to run index advisor")
+
+# ============ DATETIME MIGRATION ============
+
+# Fields that older code stored as ISO strings; new writes store BSON dates
+DATETIME_FIELDS = {
+    "leads": ["timestamp", "last_activity", "booking_datetime"],
+    "lead_activities": ["timestamp"],
+    "payment_transactions": ["timestamp", "updated_at"],
+    "blog_posts": ["timestamp"],
+    "social_media_posts": ["timestamp"],
+    "social_shares": ["timestamp"],
+    "lead_magnets": ["timestamp"],
+    "newsletter_subscriptions": ["timestamp"],
+    "affiliate_links": ["timestamp"],
+    "contact_forms": ["timestamp"],
+    "chat_messages": ["timestamp"],
+    "status_checks": ["timestamp"],
+    "page_views": ["timestamp"],
+    "tracking_events": ["timestamp"],
+    "webhook_logs": ["timestamp"],
+}
+
+DATETIME_MIGRATION_BATCH_SIZE = 1000
+
+datetime_migration_status = {
+    "running": False,
+    "started_at": None,
+    "finished_at": None,
+    "converted": {},
+    "failed": {},
+    "error": None
+}
+
+def as_utc(value: datetime) -> datetime:
+    """Treat naive datetimes as UTC so they compare with stored BSON dates"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+async def migrate_datetime_field(collection_name: str, field: str) -> tuple:
+    """Convert one string date field to BSON dates in _id-ordered batches"""
+    collection = db[collection_name]
+    converted = failed = 0
+    last_id = None
+    while True:
+        query = {field: {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await collection.find(query, {"_id": 1, field: 1}).sort("_id", ASCENDING).limit(DATETIME_MIGRATION_BATCH_SIZE).to_list(DATETIME_MIGRATION_BATCH_SIZE)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        
+        operations = []
+        for doc in docs:
+            try:
+                value = as_utc(datetime.fromisoformat(doc[field]))
+            except ValueError:
+                failed += 1
+                continue
+            # Match on the old value so a concurrent write is never overwritten
+            operations.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+        
+        if operations:
+            result = await collection.bulk_write(operations, ordered=False)
+            converted += result.modified_count
+        # Let request handlers run between batches
+        await asyncio.sleep(0)
+    return converted, failed
+
+async def migrate_datetime_fields():
+    """Background job: convert every legacy ISO string date to a BSON date"""
+    status = datetime_migration_status
+    status.update({
+        "running": True,
+        "started_at": datetime.now(timezone.utc),
+        "finished_at": None,
+        "converted": {},
+        "failed": {},
+        "error": None
+    })
+    try:
+        for collection_name, fields in DATETIME_FIELDS.items():
+            for field in fields:
+                converted, failed = await migrate_datetime_field(collection_name, field)
+                key = f"{collection_name}.{field}"
+                status["converted"][key] = converted
+                if failed:
+                    status["failed"][key] = failed
+        logging.info(f"Datetime migration finished: {sum(status['converted'].values())} values converted")
+    except Exception as e:
+        status["error"] = str(e)
+        logging.error(f"Datetime migration error: {str(e)}")
+    finally:
+        status["running"] = False
+        status["finished_at"] = datetime.now(timezone.utc)
+
+@api_router.post("/admin/migrations/datetimes")
+async def start_datetime_migration(background_tasks: BackgroundTasks, _: None = Depends(verify_admin_key)):
+    """Start converting legacy string timestamps to BSON dates (PROTECTED)"""
+    if datetime_migration_status["running"]:
+        return {"started": False, "message": "Migration already running", "status": datetime_migration_status}
+    background_tasks.add_task(migrate_datetime_fields)
+    return {"started": True, "message": "Migration started"}
+
+@api_router.get("/admin/migrations/datetimes")
+async def get_datetime_migration_status(_: None = Depends(verify_admin_key)):
+    """Get progress of the datetime migration (PROTECTED)"""
+    return datetime_migration_status
+
+# ============ EMAIL KEY MIGRATION ============
+
+# Collections keyed by a unique normalized email; rows written before normalize_email
+# may be mixed-case or padded, and may duplicate each other once normalized
+EMAIL_KEYED_COLLECTIONS = ["leads", "newsletter_subscriptions"]
+EMAIL_MIGRATION_ID = "normalize_emails"
+EMAIL_MIGRATION_BATCH_SIZE = 1000
+# normalize_email as an aggregation expression
+NORMALIZED_EMAIL_EXPR = {"$toLower": {"$trim": {"input": "$email"}}}
+
+email_migration_status = {
+    "running": False,
+    "started_at": None,
+    "finished_at": None,
+    "normalized": {},
+    "merged": {},
+    "error": None
+}
+
+async def merge_email_duplicates(collection_name: str, docs: List[Dict], email: str) -> int:
+    """Fold documents that share a normalized email into the oldest one.
+    
+    Fields the survivor lacks are filled from the duplicates; for leads the
+    activities are re-pointed and the highest score and latest activity kept.
+    Returns the number of duplicates removed.
+    """
+    docs = sorted(docs, key=lambda doc: doc["_id"])
+    survivor, duplicates = docs[0], docs[1:]
+    if not duplicates:
+        return 0
+    update = {"email": email}
+    for doc in duplicates:
+        for field, value in doc.items():
+            if field not in ("_id", "id", "email") and value is not None and survivor.get(field) is None:
+                update.setdefault(field, value)
+    if collection_name == "leads" and survivor.get("id"):
+        await db.lead_activities.update_many(
+            {"lead_id": {"$in": [doc["id"] for doc in duplicates if doc.get("id")]}},
+            {"$set": {"lead_id": survivor["id"]}}
+        )
+        update["lead_score"] = max(doc.get("lead_score") or 0 for doc in docs)
+        activity = [doc["last_activity"] for doc in docs if isinstance(doc.get("last_activity"), datetime)]
+        if activity:
+            update["last_activity"] = max(activity)
+    elif collection_name == "newsletter_subscriptions" and any(doc.get("status") == "active" for doc in docs):
+        update["status"] = "active"
+    # Duplicates go first so the survivor can take the email under a unique index
+    await db[collection_name].delete_many({"_id": {"$in": [doc["_id"] for doc in duplicates]}})
+    await db[collection_name].update_one({"_id": survivor["_id"]}, {"$set": update})
+    return len(duplicates)
+
+async def migrate_email_key(collection_name: str) -> tuple:
+    """Merge emails that normalize alike, then normalize the rest in _id-ordered batches"""
+    collection = db[collection_name]
+    normalized = merged = 0
+    
+    groups = collection.aggregate([
+        {"$match": {"email": {"$type": "string"}}},
+        {"$group": {"_id": NORMALIZED_EMAIL_EXPR, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    async for group in groups:
+        docs = await collection.find({"_id": {"$in": group["ids"]}}).to_list(None)
+        merged += await merge_email_duplicates(collection_name, docs, normalize_email(group["_id"]))
+    
+    last_id = None
+    while True:
+        query = {"email": {"$type": "string"}, "$expr": {"$ne": ["$email", NORMALIZED_EMAIL_EXPR]}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await collection.find(query, {"_id": 1, "email": 1}).sort("_id", ASCENDING).limit(EMAIL_MIGRATION_BATCH_SIZE).to_list(EMAIL_MIGRATION_BATCH_SIZE)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        
+        # Match on the old value so a concurrent write is never overwritten
+        operations = [
+            UpdateOne({"_id": doc["_id"], "email": doc["email"]}, {"$set": {"email": normalize_email(doc["email"])}})
+            for doc in docs
+        ]
+        try:
+            result = await collection.bulk_write(operations, ordered=False)
+            normalized += result.modified_count
+        except BulkWriteError as e:
+            normalized += e.details.get("nModified", 0)
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") != 11000:
+                    raise
+                # A normalized twin was written since the merge pass; fold this row into it
+                doc = docs[error["index"]]
+                email = normalize_email(doc["email"])
+                twins = await collection.find({"$or": [{"_id": doc["_id"]}, {"email": email}]}).to_list(None)
+                merged += await merge_email_duplicates(collection_name, twins, email)
+        # Let request handlers run between batches
+        await asyncio.sleep(0)
+    return normalized, merged
+
+async def migrate_email_keys():
+    """Normalize and dedupe every email-keyed collection, then record completion"""
+    status = email_migration_status
+    status.update({
+        "running": True,
+        "started_at": datetime.now(timezone.utc),
+        "finished_at": None,
+        "normalized": {},
+        "merged": {},
+        "error": None
+    })
+    try:
+        for collection_name in EMAIL_KEYED_COLLECTIONS:
+            normalized, merged = await migrate_email_key(collection_name)
+            status["normalized"][collection_name] = normalized
+            status["merged"][collection_name] = merged
+        await db.migrations.update_one(
+            {"id": EMAIL_MIGRATION_ID},
+            {"$set": {"finished_at": datetime.now(timezone.utc), "normalized": status["normalized"], "merged": status["merged"]}},
+            upsert=True
+        )
+        logging.info(f"Email migration finished: normalized {status['normalized']}, merged {status['merged']}")
+    except Exception as e:
+        status["error"] = str(e)
+        logging.error(f"Email migration error: {str(e)}")
+    finally:
+        status["running"] = False
+        status["finished_at"] = datetime.now(timezone.utc)
+
+async def ensure_email_keys_migrated():
+    """Run the email migration once, before ensure_indexes builds the unique email indexes"""
+    if await db.migrations.find_one({"id": EMAIL_MIGRATION_ID}, {"_id": 1}):
+        return
+    await migrate_email_keys()
+
+@api_router.post("/admin/migrations/emails")
+async def start_email_migration(background_tasks: BackgroundTasks, _: None = Depends(verify_admin_key)):
+    """Normalize and dedupe emails in leads and subscriptions again (PROTECTED)"""
+    if email_migration_status["running"]:
+        return {"started": False, "message": "Migration already running", "status": email_migration_status}
+    background_tasks.add_task(migrate_email_keys)
+    return {"started": True, "message": "Migration started"}
+
+@api_router.get("/admin/migrations/emails")
+async def get_email_migration_status(_: None = Depends(verify_admin_key)):
+    """Get progress of the email migration (PROTECTED)"""
+    return email_migration_status
+
+# ============ RESPONSE COMPRESSION ============
+
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+COMPRESSIBLE_CONTENT_TYPES = {
+    "application/json", "application/x-ndjson", "application/xml",
+    "application/javascript", "image/svg+xml", "text/csv"
+}
+
+compression_stats = {
+    "compressed_responses": 0,
+    "precompressed_responses": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "by_encoding": {"gzip": 0, "br": 0}
+}
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_CONTENT_TYPES
+
+class StreamCompressor:
+    """Incremental gzip or brotli encoder with one compress/flush interface"""
+    
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits=31 writes a gzip container
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data) if self.encoding == "br" else self.compressor.compress(data)
+    
+    def flush(self) -> bytes:
+        return self.compressor.finish() if self.encoding == "br" else self.compressor.flush()
+
+class CompressionMiddleware:
+    """ASGI middleware that gzip/brotli-encodes responses worth compressing.
+    
+    Bodies smaller than `minimum_size` or outside COMPRESSIBLE_CONTENT_TYPES go
+    out untouched, as do responses that already carry Content-Encoding, such as
+    the pre-gzipped sitemaps. Streaming responses are compressed chunk by chunk.
+    """
+    
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        accept_encoding = request_headers.get("accept-encoding", "")
+        if_none_match = request_headers.get("if-none-match")
+        candidates = (["br"] if brotli is not None else []) + ["gzip"]
+        encoding = next((candidate for candidate in candidates if accepts_encoding(accept_encoding, candidate)), None)
+        
+        start_message = None
+        compressor = None
+        passthrough = False
+        
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(scope=start_message)
+                status = start_message["status"]
+                compressible = is_compressible(headers.get("content-type", ""))
+                precompressed = "content-encoding" in headers
+                if precompressed:
+                    compression_stats["precompressed_responses"] += 1
+                # Identity, small and 304 responses vary too, or a shared cache hands them to every client
+                if (compressible or status == 304) and "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+                if status == 304 and "etag" in headers:
+                    headers["ETag"] = self.revalidated_etag(headers["etag"], if_none_match, encoding)
+                if (encoding is None or not compressible or precompressed or status in (204, 304)
+                        or (not more_body and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                
+                compressor = StreamCompressor(encoding)
+                headers["Content-Encoding"] = encoding
+                if "etag" in headers:
+                    headers["ETag"] = headers["etag"][:-1] + f'-{encoding}"'
+                if not more_body:
+                    compressed = compressor.compress(body) + compressor.flush()
+                    headers["Content-Length"] = str(len(compressed))
+                    self.record(encoding, len(body), len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                del headers["Content-Length"]
+                await send(start_message)
+            
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.flush()
+            compression_stats["bytes_in"] += len(body)
+            compression_stats["bytes_out"] += len(chunk)
+            if not more_body:
+                compression_stats["compressed_responses"] += 1
+                compression_stats["by_encoding"][encoding] += 1
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+        
+        await self.app(scope, receive, send_compressed)
+    
+    @staticmethod
+    def revalidated_etag(etag: str, if_none_match: Optional[str], encoding: Optional[str]) -> str:
+        """The ETag a 304 should carry: the encoded variant the client revalidated, if it still applies"""
+        variant = etag[:-1] + f'-{encoding}"' if encoding is not None else None
+        for candidate in (if_none_match or "").split(","):
+            if candidate.strip().removeprefix("W/") == variant:
+                return variant
+        return etag
+    
+    @staticmethod
+    def record(encoding: str, bytes_in: int, bytes_out: int):
+        compression_stats["compressed_responses"] += 1
+        compression_stats["by_encoding"][encoding] += 1
+        compression_stats["bytes_in"] += bytes_in
+        compression_stats["bytes_out"] += bytes_out
+
+app.add_middleware(CompressionMiddleware)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -2609,6 +5118,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -2620,10 +5130,29 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
+    rebuild_pricing_tables()
+    await detect_transaction_support()
+    # Legacy emails must be normalized and deduped before email_unique can be built
+    await ensure_email_keys_migrated()
+    await ensure_indexes()
     await initialize_blog_posts()
     await initialize_social_posts()
     await initialize_lead_magnets()
+    # Render sitemaps up front so the first crawler hit is served from memory
+    try:
+        await get_sitemap_document("main")
+    except Exception:
+        pass  # Logged by get_sitemap_document; retried on the next request
+    for buffer in WRITE_BEHIND_BUFFERS:
+        buffer.start()
+    counter_coalescer.start()
+    sessionizer_loop.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Flush buffered writes before the connection goes away
+    for buffer in WRITE_BEHIND_BUFFERS:
+        await buffer.stop()
+    await counter_coalescer.stop()
+    await sessionizer_loop.stop()
     client.close()
\ No newline at end of file
@@ -5,6 +5,11 @@ Tests: Admin authentication, Leads endpoints, Tools page APIs, Contact form, Hom
 import pytest
 import requests
 import os
+import json
+import uuid
+import time
+from datetime import datetime, timezone
+from pymongo import MongoClient
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://patjames-services.preview.emergentagent.com')
 
@@ -12,6 +17,8 @@ BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://patjames-services.pr
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "pjc_secure_2025"
 ADMIN_API_KEY = "pjc_admin_key_x7K9mP2wQ5vL8nR3"
+# Tracking endpoints drop bot traffic, so beacon tests send a browser user-agent
+BROWSER_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
 
 
 class TestHealthAndBasicEndpoints:
@@ -123,6 +130,61 @@ class TestLeadsEndpointsProtection:
         assert isinstance(data, list)
         print(f"✅ GET /leads with auth: {len(data)} leads found")
     
+    def test_get_leads_cursor_pagination(self):
+        """Test GET /leads pages with the X-Next-Cursor header without overlap"""
+        headers = {"X-Admin-Key": ADMIN_API_KEY}
+        first = requests.get(f"{BASE_URL}/api/leads", params={"limit": 2}, headers=headers)
+        assert first.status_code == 200
+        next_cursor = first.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            pytest.skip("Not enough leads to test a second page")
+        second = requests.get(
+            f"{BASE_URL}/api/leads",
+            params={"limit": 2, "cursor": next_cursor},
+            headers=headers
+        )
+        assert second.status_code == 200
+        first_ids = {lead["id"] for lead in first.json()}
+        second_ids = {lead["id"] for lead in second.json()}
+        assert first_ids.isdisjoint(second_ids)
+        print(f"✅ GET /leads cursor pagination: pages do not overlap")
+    
+    def test_get_leads_invalid_cursor(self):
+        """Test GET /leads with a malformed cursor returns 400"""
+        response = requests.get(
+            f"{BASE_URL}/api/leads",
+            params={"cursor": "not-a-cursor"},
+            headers={"X-Admin-Key": ADMIN_API_KEY}
+        )
+        assert response.status_code == 400
+        print(f"✅ GET /leads with invalid cursor correctly returns 400")
+    
+    def test_export_leads_csv(self):
+        """Test GET /leads/export streams CSV with a header row"""
+        response = requests.get(
+            f"{BASE_URL}/api/leads/export",
+            params={"format": "csv"},
+            headers={"X-Admin-Key": ADMIN_API_KEY}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        header = response.text.splitlines()[0]
+        assert "email" in header.split(",")
+        print(f"✅ GET /leads/export CSV: {len(response.text.splitlines()) - 1} rows")
+    
+    def test_export_payments_ndjson(self):
+        """Test GET /admin/payments/export streams one JSON object per line"""
+        response = requests.get(
+            f"{BASE_URL}/api/admin/payments/export",
+            params={"format": "ndjson"},
+            headers={"X-Admin-Key": ADMIN_API_KEY}
+        )
+        assert response.status_code == 200
+        lines = [line for line in response.text.splitlines() if line]
+        for line in lines:
+            assert "id" in json.loads(line)
+        print(f"✅ GET /admin/payments/export NDJSON: {len(lines)} rows")
+    
     def test_get_leads_stats_without_auth(self):
         """Test GET /leads/stats/summary without auth returns 401"""
         response = requests.get(f"{BASE_URL}/api/leads/stats/summary")
@@ -139,6 +201,18 @@ class TestLeadsEndpointsProtection:
         data = response.json()
         assert "total" in data
         print(f"✅ GET /leads/stats/summary with auth: total={data.get('total', 0)}")
+    
+    def test_get_lead_analytics_with_auth(self):
+        """Test GET /leads/analytics is routed to analytics, not the lead lookup"""
+        response = requests.get(
+            f"{BASE_URL}/api/leads/analytics",
+            headers={"X-Admin-Key": ADMIN_API_KEY}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert "total_leads" in data
+        assert isinstance(data["leads_by_status"], list)
+        print(f"✅ GET /leads/analytics with auth: total={data['total_leads']}")
 
 
 class TestLeadsCRUD:
@@ -228,6 +302,103 @@ class TestLeadsCRUD:
         assert lead_data["status"] == "contacted"
         print(f"✅ Lead status verified: {lead_data['status']}")
     
+    def test_create_lead_is_idempotent_per_email(self):
+        """Test submitting the same email twice returns the same lead"""
+        lead_data = {
+            "full_name": "TEST_Double Click",
+            "email": "test_double_click@example.com"
+        }
+        first = requests.post(f"{BASE_URL}/api/leads", json=lead_data)
+        second = requests.post(f"{BASE_URL}/api/leads", json={**lead_data, "email": " TEST_Double_Click@Example.com "})
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert first.json()["lead_id"] == second.json()["lead_id"]
+        print(f"✅ Duplicate submission resolved to lead {first.json()['lead_id']}")
+    
+    def test_bulk_import_leads_json(self, auth_headers):
+        """Test bulk import dedupes within the batch and reports bad rows"""
+        rows = [
+            {"full_name": "TEST_Bulk One", "email": "test_bulk_one@example.com"},
+            {"full_name": "TEST_Bulk One Again", "email": "TEST_BULK_ONE@example.com"},
+            {"full_name": "TEST_Missing Email"}
+        ]
+        response = requests.post(f"{BASE_URL}/api/leads/bulk", json=rows, headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["received"] == 3
+        assert data["inserted"] + data["duplicates"] == 2
+        assert data["errors"][0]["row"] == 3
+        print(f"✅ Bulk import: inserted={data['inserted']} duplicates={data['duplicates']}")
+    
+    def test_bulk_import_leads_csv(self, auth_headers):
+        """Test bulk import accepts CSV with a header row"""
+        body = "full_name,email,lead_source\nTEST_Csv Lead,test_bulk_csv@example.com,referral\n"
+        response = requests.post(
+            f"{BASE_URL}/api/leads/bulk",
+            data=body,
+            headers={**auth_headers, "Content-Type": "text/csv"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["received"] == 1
+        assert data["failed"] == 0
+        print(f"✅ Bulk CSV import: {data['rows_per_second']} rows/s")
+    
+    def test_bulk_update_leads(self, auth_headers):
+        """Test PATCH /leads/bulk updates every listed lead"""
+        lead_ids = []
+        for i in range(2):
+            create_response = requests.post(f"{BASE_URL}/api/leads", json={
+                "full_name": f"TEST_Bulk Update {i}",
+                "email": f"test_bulk_update_{i}@example.com"
+            })
+            lead_ids.append(create_response.json().get("lead_id"))
+        
+        response = requests.patch(
+            f"{BASE_URL}/api/leads/bulk",
+            json={"lead_ids": lead_ids, "update": {"status": "contacted"}},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["matched"] == 2
+        for lead_id in lead_ids:
+            lead = requests.get(f"{BASE_URL}/api/leads/{lead_id}", headers=auth_headers).json()
+            assert lead["status"] == "contacted"
+        print(f"✅ Bulk update: matched={data['matched']} modified={data['modified']}")
+    
+    def test_bulk_update_requires_selector(self, auth_headers):
+        """Test PATCH /leads/bulk refuses to update without ids or filter"""
+        response = requests.patch(
+            f"{BASE_URL}/api/leads/bulk",
+            json={"update": {"status": "lost"}},
+            headers=auth_headers
+        )
+        assert response.status_code == 400
+        print(f"✅ Bulk update without selector correctly returns 400")
+    
+    def test_lead_activity_timeline(self, auth_headers):
+        """Test tracked activities show up in the lead's timeline and cap the score"""
+        create_response = requests.post(f"{BASE_URL}/api/leads", json={
+            "full_name": "TEST_Timeline Lead",
+            "email": "test_timeline@example.com"
+        })
+        lead_id = create_response.json().get("lead_id")
+        for _ in range(4):
+            response = requests.post(
+                f"{BASE_URL}/api/leads/{lead_id}/activity",
+                params={"activity_type": "consultation_booked"}
+            )
+            assert response.status_code == 200
+        
+        response = requests.get(f"{BASE_URL}/api/leads/{lead_id}/activities", headers=auth_headers)
+        assert response.status_code == 200
+        activities = response.json()
+        assert any(a["activity_type"] == "consultation_booked" for a in activities)
+        lead = requests.get(f"{BASE_URL}/api/leads/{lead_id}", headers=auth_headers).json()
+        assert lead["lead_score"] <= 100
+        print(f"✅ Activity timeline: {len(activities)} activities, score={lead['lead_score']}")
+    
     def test_delete_lead(self, auth_headers):
         """Test deleting a lead"""
         # First create a lead
@@ -342,6 +513,543 @@ class TestNewsletterSubscription:
         assert response.status_code in [200, 201]
         print(f"✅ Newsletter subscription: status={response.status_code}")
 
+class TestIndexAdvisor:
+    """Test the index advisor admin endpoint"""
+    
+    def test_index_advisor_without_auth(self):
+        """Test GET /admin/indexes/advisor without auth returns 401"""
+        response = requests.get(f"{BASE_URL}/api/admin/indexes/advisor")
+        assert response.status_code == 401
+        print(f"✅ Index advisor without auth correctly returns 401")
+    
+    def test_index_advisor_reports_no_collection_scans(self):
+        """Test that every canonical route query is index-backed"""
+        response = requests.get(
+            f"{BASE_URL}/api/admin/indexes/advisor",
+            headers={"X-Admin-Key": ADMIN_API_KEY}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert "queries" in data
+        scans = [q["route"] for q in data["queries"] if q["collection_scan"]]
+        assert scans == []
+        print(f"✅ Index advisor: {len(data['queries'])} queries, no collection scans")
+
+class TestDatetimeMigration:
+    """Test the string-to-BSON-date migration admin endpoints"""
+    
+    def test_migration_status_without_auth(self):
+        """Test GET /admin/migrations/datetimes without auth returns 401"""
+        response = requests.get(f"{BASE_URL}/api/admin/migrations/datetimes")
+        assert response.status_code == 401
+        print(f"✅ Migration status without auth correctly returns 401")
+    
+    def test_start_migration_and_read_status(self):
+        """Test starting the migration and reading its progress"""
+        headers = {"X-Admin-Key": ADMIN_API_KEY}
+        response = requests.post(f"{BASE_URL}/api/admin/migrations/datetimes", headers=headers)
+        assert response.status_code == 200
+        assert "started" in response.json()
+        status = requests.get(f"{BASE_URL}/api/admin/migrations/datetimes", headers=headers)
+        assert status.status_code == 200
+        assert "converted" in status.json()
+        print(f"✅ Datetime migration status: running={status.json()['running']}")
+
+
+class TestEmailMigration:
+    """Test the email normalization / dedupe migration"""
+    
+    def test_email_migration_status_without_auth(self):
+        """Test GET /admin/migrations/emails without auth returns 401"""
+        response = requests.get(f"{BASE_URL}/api/admin/migrations/emails")
+        assert response.status_code == 401
+        print("✅ Email migration status without auth correctly returns 401")
+    
+    def test_legacy_mixed_case_lead_is_merged(self):
+        """Test a padded mixed-case legacy lead is merged into its normalized twin and then upserted"""
+        if not (os.environ.get("MONGO_URL") and os.environ.get("DB_NAME")):
+            pytest.skip("MONGO_URL/DB_NAME not set; cannot seed legacy leads")
+        leads = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]].leads
+        email = f"test_legacy_{uuid.uuid4().hex[:8]}@example.com"
+        now = datetime.now(timezone.utc)
+        leads.insert_many([
+            {"id": str(uuid.uuid4()), "full_name": "TEST Legacy", "email": f"  {email.upper()} ", "phone": "555-0100",
+             "lead_score": 40, "status": "new", "timestamp": now, "last_activity": now},
+            {"id": str(uuid.uuid4()), "full_name": "TEST Legacy", "email": email, "lead_score": 10,
+             "status": "new", "timestamp": now, "last_activity": now},
+        ])
+        headers = {"X-Admin-Key": ADMIN_API_KEY}
+        try:
+            assert requests.post(f"{BASE_URL}/api/admin/migrations/emails", headers=headers).status_code == 200
+            for _ in range(50):
+                if not requests.get(f"{BASE_URL}/api/admin/migrations/emails", headers=headers).json()["running"]:
+                    break
+                time.sleep(0.2)
+            merged = list(leads.find({"full_name": "TEST Legacy", "email": {"$regex": email.split("@")[0], "$options": "i"}}))
+            assert len(merged) == 1
+            assert merged[0]["email"] == email
+            assert merged[0]["phone"] == "555-0100" and merged[0]["lead_score"] == 40
+            response = requests.post(f"{BASE_URL}/api/leads", json={"full_name": "TEST Legacy", "email": f" {email.title()}"})
+            assert response.json()["lead_id"] == merged[0]["id"]
+            print(f"✅ Legacy email merged into one lead: {merged[0]['id']}")
+        finally:
+            leads.delete_many({"full_name": "TEST Legacy"})
+
+class TestTrackingBuffers:
+    """Test write-behind buffering of tracking events"""
+    
+    def test_tracking_pixel_returns_gif(self):
+        """Test the pixel responds with a GIF as soon as the hit is queued"""
+        response = requests.get(f"{BASE_URL}/api/tracking/pixel.gif", params={"event": "test_open"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/gif"
+        print(f"✅ Tracking pixel returned {len(response.content)} bytes")
+    
+    def test_tracking_batch_beacon(self):
+        """Test a sendBeacon-style text/plain batch is accepted in one request"""
+        events = [
+            {"event_name": "page_view", "page": "/services", "session_id": "test-session-batch"},
+            {"event_name": "cta_click", "event_data": {"cta": "get-quote"}, "session_id": "test-session-batch"},
+            {"event_data": {"missing": "event_name"}}
+        ]
+        response = requests.post(
+            f"{BASE_URL}/api/tracking/batch",
+            data=json.dumps(events),
+            headers={"Content-Type": "text/plain;charset=UTF-8", "User-Agent": BROWSER_USER_AGENT}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["accepted"] == 2
+        assert data["rejected"] == 1
+        print(f"✅ Tracking batch: accepted={data['accepted']} rejected={data['rejected']}")
+    
+    def test_tracking_batch_filters_bots(self):
+        """Test crawler hits are classified as bots before they are written"""
+        events = [{"event_name": "page_view", "page": "/services", "session_id": "test-session-bot"}]
+        response = requests.post(
+            f"{BASE_URL}/api/tracking/batch",
+            data=json.dumps(events),
+            headers={"User-Agent": "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"}
+        )
+        assert response.status_code == 200
+        metrics = requests.get(f"{BASE_URL}/api/admin/metrics", headers={"X-Admin-Key": ADMIN_API_KEY}).json()
+        bot_filter = metrics["bot_filter"]
+        assert bot_filter["bots"] >= 1
+        if bot_filter["mode"] == "drop":
+            assert response.json()["accepted"] == 0
+        print(f"✅ Bot filter: {bot_filter['bots']} of {bot_filter['hits']} hits ({bot_filter['mode']})")
+    
+    @pytest.mark.parametrize("user_agent", [
+        "Mozilla/5.0 (Linux; Android 10; CUBOT X19 Build/QP1A.190711.020) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36",
+        "Mozilla/5.0 (Linux; Android 12; CUBOT KINGKONG 9) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36",
+    ])
+    def test_tracking_batch_keeps_phones_named_bot(self, user_agent):
+        """Test device names containing "bot" (CUBOT phones) are not classified as bots"""
+        events = [{"event_name": "page_view", "page": "/services", "session_id": f"test-session-{uuid.uuid4().hex[:8]}"}]
+        response = requests.post(
+            f"{BASE_URL}/api/tracking/batch",
+            data=json.dumps(events),
+            headers={"User-Agent": user_agent}
+        )
+        assert response.status_code == 200
+        assert response.json()["accepted"] == 1
+        print(f"✅ Phone user-agent kept: {user_agent[:40]}...")
+    
+    @pytest.mark.parametrize("user_agent", [
+        "Mozilla/5.0 (Windows NT 5.1; rv:11.0) Gecko Firefox/11.0 (via ggpht.com GoogleImageProxy)",
+        "YahooMailProxy; https://help.yahoo.com/kb/yahoo-mail-proxy-SLN28749.html",
+    ])
+    def test_tracking_pixel_counts_email_image_proxies(self, user_agent):
+        """Test email opens fetched through Gmail/Yahoo image proxies are not dropped as bots"""
+        headers = {"X-Admin-Key": ADMIN_API_KEY}
+        before = requests.get(f"{BASE_URL}/api/admin/metrics", headers=headers).json()["bot_filter"]
+        response = requests.get(
+            f"{BASE_URL}/api/tracking/pixel.gif",
+            params={"event": "test_email_open"},
+            headers={"User-Agent": user_agent}
+        )
+        assert response.status_code == 200
+        after = requests.get(f"{BASE_URL}/api/admin/metrics", headers=headers).json()["bot_filter"]
+        assert after["image_proxy_hits"] >= before["image_proxy_hits"] + 1
+        print(f"✅ Email image proxy open counted: {after['image_proxy_hits']} proxy hits")
+    
+    def test_performance_reads_buckets_for_range(self):
+        """Test /analytics/performance accepts a time range"""
+        response = requests.get(
+            f"{BASE_URL}/api/analytics/performance",
+            params={"since": "2025-01-01T00:00:00Z"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert isinstance(data["page_views"], list)
+        assert data["range"]["since"].startswith("2025-01-01")
+        print(f"✅ Performance data: {len(data['page_views'])} pages in range")
+    
+    def test_performance_reports_unique_visitors(self):
+        """Test /analytics/performance exposes a unique visitor estimate"""
+        requests.post(
+            f"{BASE_URL}/api/analytics/page-view",
+            params={"page": "/test-unique", "session_id": "test-session-unique"}
+        )
+        response = requests.get(f"{BASE_URL}/api/analytics/performance")
+        assert response.status_code == 200
+        data = response.json()
+        assert isinstance(data["unique_visitors"], int)
+        assert "pixel" in data["unique_visitors_basis"]
+        for view in data["page_views"]:
+            assert isinstance(view["unique_visitors"], int)
+        print(f"✅ Unique visitors (30 days): {data['unique_visitors']}")
+    
+    def test_engagement_reads_include_pending_counts(self):
+        """Test coalesced engagement counts are visible before they are flushed"""
+        posts = requests.get(f"{BASE_URL}/api/social/posts", params={"limit": 1}).json()
+        if not posts:
+            pytest.skip("No published social posts")
+        post_id = posts[0]["id"]
+        before = requests.get(f"{BASE_URL}/api/social/posts/{post_id}").json()["likes"]
+        response = requests.post(f"{BASE_URL}/api/social/posts/{post_id}/engage", params={"action": "like"})
+        assert response.status_code == 200
+        after = requests.get(f"{BASE_URL}/api/social/posts/{post_id}").json()["likes"]
+        assert after >= before + 1
+        print(f"✅ Likes {before} -> {after} without waiting for the flush")
+    
+    def test_metrics_report_buffer_depth(self):
+        """Test /admin/metrics reports queue depth for each buffer"""
+        response = requests.get(f"{BASE_URL}/api/admin/metrics", headers={"X-Admin-Key": ADMIN_API_KEY})
+        assert response.status_code == 200
+        buffers = response.json()["write_buffers"]
+        assert "tracking_events" in buffers
+        assert "queue_depth" in buffers["tracking_events"]
+        print(f"✅ Buffer metrics: {buffers['tracking_events']}")
+
+
+class TestFunnel:
+    """Test sessionized funnel conversion"""
+    
+    def test_funnel_requires_admin(self):
+        """Test funnel analytics are admin-only"""
+        response = requests.get(f"{BASE_URL}/api/analytics/funnel")
+        assert response.status_code in [401, 403]
+        print("✅ Funnel requires admin key")
+    
+    def test_funnel_steps_are_monotonic(self):
+        """Test each funnel step has no more sessions than the one before"""
+        response = requests.get(f"{BASE_URL}/api/analytics/funnel", headers={"X-Admin-Key": ADMIN_API_KEY})
+        assert response.status_code == 200
+        data = response.json()
+        counts = [step["sessions"] for step in data["steps"]]
+        assert [step["step"] for step in data["steps"]] == ["quote_form", "thank_you", "checkout"]
+        assert counts == sorted(counts, reverse=True)
+        assert data["total_sessions"] >= (counts[0] if counts else 0)
+        assert "sessionized_through" in data
+        print(f"✅ Funnel: {counts} of {data['total_sessions']} sessions")
+    
+    def test_sessionizer_runs_in_background(self):
+        """Test the sessionizer reports its background runs in /admin/metrics"""
+        response = requests.get(f"{BASE_URL}/api/admin/metrics", headers={"X-Admin-Key": ADMIN_API_KEY})
+        assert response.status_code == 200
+        sessionizer = response.json()["sessionizer"]
+        assert sessionizer["runs"] >= 0 and sessionizer["errors"] >= 0
+        print(f"✅ Sessionizer: {sessionizer['runs']} runs, {sessionizer['events_processed']} events")
+
+
+class TestContentCache:
+    """Test the in-process cache in front of public content endpoints"""
+    
+    def test_cache_stats_require_admin(self):
+        """Test cache stats are admin-only"""
+        response = requests.get(f"{BASE_URL}/api/admin/cache/stats")
+        assert response.status_code in [401, 403]
+        print("✅ Cache stats require admin key")
+    
+    def test_repeated_blog_reads_hit_cache(self):
+        """Test a second identical blog read is served from the cache"""
+        first = requests.get(f"{BASE_URL}/api/blog", params={"limit": 3})
+        second = requests.get(f"{BASE_URL}/api/blog", params={"limit": 3})
+        assert first.status_code == 200
+        assert first.json() == second.json()
+        response = requests.get(f"{BASE_URL}/api/admin/cache/stats", headers={"X-Admin-Key": ADMIN_API_KEY})
+        assert response.status_code == 200
+        blog = response.json()["namespaces"]["blog"]
+        assert blog["hits"] >= 1
+        print(f"✅ Blog cache: {blog['hits']} hits, {blog['misses']} misses")
+    
+    def test_cache_reports_backend(self):
+        """Test cache stats name the configured backend"""
+        response = requests.get(f"{BASE_URL}/api/admin/cache/stats", headers={"X-Admin-Key": ADMIN_API_KEY})
+        assert response.status_code == 200
+        assert response.json()["backend"] in ["memory", "redis"]
+        print(f"✅ Cache backend: {response.json()['backend']}")
+    
+    def test_site_settings_update_invalidates_cache(self):
+        """Test updating site settings is visible on the next read"""
+        original = requests.get(f"{BASE_URL}/api/site-settings").json()
+        tagline = f"Cache test {uuid.uuid4().hex[:8]}"
+        requests.post(f"{BASE_URL}/api/site-settings", json={**original, "tagline": tagline})
+        try:
+            assert requests.get(f"{BASE_URL}/api/site-settings").json()["tagline"] == tagline
+            print("✅ Site settings cache invalidated on update")
+        finally:
+            requests.post(f"{BASE_URL}/api/site-settings", json=original)
+
+
+class TestConditionalResponses:
+    """Test ETag / Last-Modified revalidation on content routes"""
+    
+    @pytest.mark.parametrize("path", ["/api/packages", "/api/blog", "/api/sitemap.xml", "/api/seo/sitemap.xml", "/api/robots.txt", "/api/seo/meta"])
+    def test_if_none_match_returns_304(self, path):
+        """Test replaying the ETag gets an empty 304"""
+        response = requests.get(f"{BASE_URL}{path}")
+        assert response.status_code == 200
+        etag = response.headers.get("etag")
+        assert etag and "cache-control" in response.headers
+        revalidated = requests.get(f"{BASE_URL}{path}", headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        print(f"✅ {path} revalidates with ETag {etag}")
+    
+    def test_if_modified_since_returns_304(self):
+        """Test replaying Last-Modified gets a 304 when no ETag is sent"""
+        response = requests.get(f"{BASE_URL}/api/packages")
+        last_modified = response.headers.get("last-modified")
+        assert last_modified
+        revalidated = requests.get(f"{BASE_URL}/api/packages", headers={"If-Modified-Since": last_modified})
+        assert revalidated.status_code == 304
+        print(f"✅ /api/packages revalidates with Last-Modified {last_modified}")
+    
+    def test_stale_etag_returns_full_body(self):
+        """Test a non-matching ETag gets the full response"""
+        response = requests.get(f"{BASE_URL}/api/packages", headers={"If-None-Match": '"stale"'})
+        assert response.status_code == 200
+        assert "packages" in response.json()
+        print("✅ Stale ETag returns full body")
+
+
+class TestSitemaps:
+    """Test prebuilt, pre-compressed sitemaps"""
+    
+    def test_sitemap_served_gzipped(self):
+        """Test the extended sitemap is sent gzip-encoded when accepted"""
+        response = requests.get(f"{BASE_URL}/api/seo/sitemap.xml", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") == "gzip"
+        assert "Accept-Encoding" in response.headers.get("vary", "")
+        assert "<urlset" in response.text or "<sitemapindex" in response.text
+        print(f"✅ Extended sitemap: {len(response.content)} bytes decompressed")
+    
+    def test_sitemap_served_uncompressed(self):
+        """Test clients without gzip get plain XML"""
+        response = requests.get(f"{BASE_URL}/api/sitemap.xml", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert response.text.startswith("<?xml")
+        print("✅ Main sitemap served uncompressed")
+    
+    def test_missing_sitemap_shard_404(self):
+        """Test a shard past the index returns 404"""
+        response = requests.get(f"{BASE_URL}/api/seo/sitemap-9999.xml")
+        assert response.status_code == 404
+        print("✅ Missing sitemap shard returns 404")
+
+
+class TestPricingTables:
+    """Test quotes served from the prebuilt pricing tables"""
+    
+    def test_quote_matches_package_pricing(self):
+        """Test a prebuilt quote carries the same numbers as the catalog"""
+        packages = {p["id"]: p for p in requests.get(f"{BASE_URL}/api/packages").json()["packages"]}
+        growth = packages["growth"]
+        response = requests.get(f"{BASE_URL}/api/calculate-price/growth", params={"pages": growth["included_pages"] + 2})
+        assert response.status_code == 200
+        quote = response.json()
+        assert quote["final_price"] == growth["base_price"] + 2 * growth["additional_page_price"]
+        assert response.headers.get("etag")
+        print(f"✅ Growth +2 pages quote: ${quote['final_price']}")
+    
+    def test_quote_over_max_pages_rejected(self):
+        """Test page counts outside the table still fail validation"""
+        response = requests.get(f"{BASE_URL}/api/calculate-price/starter", params={"pages": 500})
+        assert response.status_code == 400
+        print("✅ Over-max quote rejected")
+    
+    def test_batch_quotes(self):
+        """Test many quotes come back in one response, with per-item errors"""
+        pairs = [{"package_id": "starter", "pages": 5}, {"package_id": "scale", "pages": 20}, {"package_id": "nope", "pages": 1}]
+        response = requests.post(f"{BASE_URL}/api/calculate-price/batch", json={"quotes": pairs})
+        assert response.status_code == 200
+        quotes = response.json()["quotes"]
+        assert len(quotes) == 3
+        single = requests.get(f"{BASE_URL}/api/calculate-price/starter", params={"pages": 5}).json()
+        assert quotes[0]["quote"] == single
+        assert "error" in quotes[2]
+        print(f"✅ Batch quotes: {[q.get('quote', {}).get('final_price') for q in quotes]}")
+    
+    def test_cheapest_package(self):
+        """Test the cheapest web design package for a page count"""
+        response = requests.get(f"{BASE_URL}/api/calculate-price/cheapest", params={"pages": 12, "service_type": "web_design"})
+        assert response.status_code == 200
+        data = response.json()
+        prices = [item["final_price"] for item in data["ranked"]]
+        assert prices == sorted(prices)
+        assert data["cheapest"]["final_price"] == prices[0]
+        assert "starter" not in [item["package_id"] for item in data["ranked"]]
+        print(f"✅ Cheapest for 12 pages: {data['cheapest']['package_id']} at ${prices[0]}")
+    
+    def test_cheapest_package_defaults_to_web_design(self):
+        """Test omitting service_type ranks only page-priced web design tiers"""
+        response = requests.get(f"{BASE_URL}/api/calculate-price/cheapest", params={"pages": 12})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["cheapest"]["package_id"] == "growth"
+        assert [item["package_id"] for item in data["ranked"]] == ["growth", "scale"]
+        print(f"✅ Cheapest for 12 pages without service_type: {data['cheapest']['package_id']}")
+    
+    def test_rebuild_requires_admin(self):
+        """Test the pricing rebuild endpoint is admin-only and reports the table size"""
+        assert requests.post(f"{BASE_URL}/api/admin/pricing/rebuild").status_code in [401, 403]
+        response = requests.post(f"{BASE_URL}/api/admin/pricing/rebuild", headers={"X-Admin-Key": ADMIN_API_KEY})
+        assert response.status_code == 200
+        assert response.json()["quotes"] > 0
+        print(f"✅ Pricing tables rebuilt: {response.json()}")
+
+
+class TestCompression:
+    """Test response compression middleware"""
+    
+    def test_large_json_gzipped(self):
+        """Test a large JSON response is gzip-encoded when accepted"""
+        response = requests.get(f"{BASE_URL}/api/packages", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") == "gzip"
+        assert "packages" in response.json()
+        print("✅ /api/packages served gzipped")
+    
+    def test_small_response_not_compressed(self):
+        """Test bodies under the size threshold are sent as-is"""
+        response = requests.get(f"{BASE_URL}/api/", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        print("✅ Small response left uncompressed")
+    
+    def test_compressed_etag_revalidates(self):
+        """Test the encoded representation's ETag still yields a 304"""
+        response = requests.get(f"{BASE_URL}/api/packages", headers={"Accept-Encoding": "gzip"})
+        etag = response.headers["etag"]
+        revalidated = requests.get(f"{BASE_URL}/api/packages", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.headers["etag"] == etag
+        assert "Accept-Encoding" in revalidated.headers.get("vary", "")
+        print(f"✅ Compressed ETag {etag} revalidates")
+    
+    @pytest.mark.parametrize("path", ["/api/packages", "/api/"])
+    def test_identity_response_varies(self, path):
+        """Test uncompressed responses to clients without gzip/br still carry Vary: Accept-Encoding"""
+        response = requests.get(f"{BASE_URL}{path}", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert "Accept-Encoding" in response.headers.get("vary", "")
+        print(f"✅ Identity {path} carries Vary: Accept-Encoding")
+    
+    def test_metrics_report_bytes_saved(self):
+        """Test /admin/metrics reports compression savings"""
+        response = requests.get(f"{BASE_URL}/api/admin/metrics", headers={"X-Admin-Key": ADMIN_API_KEY})
+        compression = response.json()["compression"]
+        assert compression["bytes_saved"] >= 0
+        print(f"✅ Compression saved {compression['bytes_saved']} bytes")
+
+
+class TestTrustedReads:
+    """Test read endpoints that skip response_model validation keep their shape"""
+    
+    def test_social_posts_have_model_fields(self):
+        """Test social posts carry every SocialMediaPost field and no _id"""
+        response = requests.get(f"{BASE_URL}/api/social/posts")
+        assert response.status_code == 200
+        for post in response.json():
+            assert "_id" not in post
+            for field in ["id", "platform", "content", "likes", "comments", "shares", "hashtags", "timestamp"]:
+                assert field in post
+        print(f"✅ {len(response.json())} social posts in model shape")
+    
+    def test_affiliate_links_have_model_fields(self):
+        """Test affiliate links carry every AffiliateLink field and no _id"""
+        response = requests.get(f"{BASE_URL}/api/affiliate")
+        assert response.status_code == 200
+        for link in response.json():
+            assert "_id" not in link
+            assert set(["id", "partner_name", "link", "clicks", "timestamp"]) <= set(link)
+        print(f"✅ {len(response.json())} affiliate links in model shape")
+
+
+class TestPaymentStats:
+    """Test the single-pass payment statistics endpoint"""
+    
+    # A window no real transaction falls in, so seeded rows are the only ones counted
+    WINDOW = {"since": "2001-01-01T00:00:00Z", "until": "2001-01-01T12:00:00Z"}
+    
+    def test_payment_stats_require_admin(self):
+        """Test GET /admin/payments/stats returns 401 without the admin key"""
+        response = requests.get(f"{BASE_URL}/api/admin/payments/stats")
+        assert response.status_code == 401
+        print("✅ Payment stats require admin key")
+    
+    def test_payment_stats_shape(self):
+        """Test the stats response carries every dashboard field"""
+        response = requests.get(f"{BASE_URL}/api/admin/payments/stats", headers={"X-Admin-Key": ADMIN_API_KEY})
+        assert response.status_code == 200
+        data = response.json()
+        for field in ["total", "completed", "pending", "failed", "by_status", "total_revenue",
+                      "average_order_value", "by_method", "revenue_by_method", "revenue_by_package", "window"]:
+            assert field in data
+        assert set(data["by_method"]) == {"stripe", "paypal"}
+        assert data["total"] == sum(data["by_status"].values())
+        assert data["window"] == {"since": None, "until": None}
+        print(f"✅ Payment stats: {data['total']} transactions, ${data['total_revenue']} revenue")
+    
+    def test_payment_stats_empty_window(self):
+        """Test since/until exclude transactions outside the window"""
+        response = requests.get(
+            f"{BASE_URL}/api/admin/payments/stats",
+            params={"since": "2099-01-01T00:00:00Z", "until": "2099-01-02T00:00:00Z"},
+            headers={"X-Admin-Key": ADMIN_API_KEY}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 0 and data["by_status"] == {} and data["total_revenue"] == 0
+        assert data["window"]["since"].startswith("2099-01-01")
+        print("✅ Payment stats window excludes everything outside it")
+    
+    def test_payment_stats_window_and_unknown_status(self):
+        """Test seeded transactions are filtered by since/until and a missing status counts as unknown"""
+        if not (os.environ.get("MONGO_URL") and os.environ.get("DB_NAME")):
+            pytest.skip("MONGO_URL/DB_NAME not set; cannot seed payment_transactions")
+        collection = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]].payment_transactions
+        marker = f"TEST_stats_{uuid.uuid4().hex[:8]}"
+        seeded = [
+            # No payment_status at all
+            {"id": f"{marker}_1", "package_id": marker, "amount": 50.0, "timestamp": datetime(2001, 1, 1, 1, tzinfo=timezone.utc)},
+            {"id": f"{marker}_2", "package_id": marker, "amount": 100.0, "payment_status": "paid",
+             "metadata": {"payment_method": "paypal"}, "timestamp": datetime(2001, 1, 1, 2, tzinfo=timezone.utc)},
+            # Outside the window
+            {"id": f"{marker}_3", "package_id": marker, "amount": 999.0, "payment_status": "paid",
+             "timestamp": datetime(2001, 1, 2, tzinfo=timezone.utc)},
+        ]
+        collection.insert_many(seeded)
+        try:
+            response = requests.get(
+                f"{BASE_URL}/api/admin/payments/stats", params=self.WINDOW, headers={"X-Admin-Key": ADMIN_API_KEY}
+            )
+            assert response.status_code == 200
+            data = response.json()
+            assert data["by_status"] == {"unknown": 1, "paid": 1}
+            assert data["total"] == 2 and data["completed"] == 1
+            assert data["total_revenue"] == 100.0
+            assert data["by_method"] == {"stripe": 0, "paypal": 1}
+            assert data["revenue_by_package"] == [{"package_id": marker, "count": 1, "revenue": 100.0}]
+            print(f"✅ Payment stats window: {data['by_status']}")
+        finally:
+            collection.delete_many({"package_id": marker})
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,150 @@
+"""
+Unit Tests for the shared cache backends
+Tests: RedisCacheBackend get/set, namespace version invalidation, single-flight loads across workers
+Runs against fakeredis, or a real server when REDIS_TEST_URL is set
+"""
+import pytest
+import os
+import sys
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pjc_cache_tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+import server
+
+REDIS_TEST_URL = os.environ.get("REDIS_TEST_URL")
+if not REDIS_TEST_URL:
+    fakeredis = pytest.importorskip("fakeredis")
+
+
+def redis_client(fake_server=None):
+    """One client per simulated worker; clients on the same server share keys"""
+    if REDIS_TEST_URL:
+        return server.redis_asyncio.from_url(REDIS_TEST_URL)
+    return fakeredis.aioredis.FakeRedis(server=fake_server)
+
+
+@pytest.fixture
+def workers():
+    """Two SharedCache instances (two workers) over one Redis, with a unique key prefix"""
+    fake_server = None if REDIS_TEST_URL else fakeredis.FakeServer()
+    prefix = f"test-{uuid.uuid4().hex[:8]}"
+    return [
+        server.SharedCache(server.RedisCacheBackend(redis_client(fake_server), prefix=prefix), ttl_seconds=60)
+        for _ in range(2)
+    ]
+
+
+class CountingLoader:
+    """Loader that records how often it ran and takes a while, like a Mongo read"""
+
+    def __init__(self, value, delay: float = 0.2):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.value
+
+
+class TestRedisCacheBackend:
+    """Test the raw backend operations"""
+
+    def test_get_set_round_trip(self, workers):
+        """Test values come back intact, datetimes included, and absent keys are misses"""
+        backend = workers[0].backend
+        value = {"title": "Post", "created_at": datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc), "tags": ["a", "b"]}
+
+        async def run():
+            assert await backend.get("missing") is server.CACHE_MISS
+            await backend.set("post", value, 60)
+            await backend.set("empty", None, 60)
+            return await backend.get("post"), await backend.get("empty")
+
+        post, empty = asyncio.run(run())
+        assert post == value
+        assert empty is None
+        print("✅ Redis backend round-trips values and cached None")
+
+    def test_set_expires(self, workers):
+        """Test entries expire after their TTL"""
+        backend = workers[0].backend
+
+        async def run():
+            await backend.set("short", "value", 0.05)
+            await asyncio.sleep(0.2)
+            return await backend.get("short")
+
+        assert asyncio.run(run()) is server.CACHE_MISS
+        print("✅ Redis backend entries expire")
+
+    def test_lock_is_exclusive(self, workers):
+        """Test only one worker holds a fill lock until it is released"""
+        first, second = workers[0].backend, workers[1].backend
+
+        async def run():
+            taken = [await first.acquire_lock("lock:key", 5), await second.acquire_lock("lock:key", 5)]
+            await first.release_lock("lock:key")
+            taken.append(await second.acquire_lock("lock:key", 5))
+            return taken
+
+        assert asyncio.run(run()) == [True, False, True]
+        print("✅ Redis fill lock is exclusive")
+
+
+class TestSharedCacheOverRedis:
+    """Test invalidation and single-flight through SharedCache"""
+
+    def test_invalidate_bumps_version_for_every_worker(self, workers):
+        """Test an invalidation on one worker makes the other reload"""
+        first, second = workers
+        loader = CountingLoader(["post"], delay=0)
+
+        async def run():
+            await first.get_or_load("blog", (10,), loader)
+            await second.get_or_load("blog", (10,), loader)
+            before = await second.namespace_version("blog")
+            await first.invalidate("blog")
+            after = await second.namespace_version("blog")
+            await second.get_or_load("blog", (10,), loader)
+            return before, after
+
+        before, after = asyncio.run(run())
+        assert after == before + 1
+        assert loader.calls == 2
+        assert second.stats["blog"]["hits"] == 1
+        print(f"✅ Invalidation bumped version {before} -> {after} for both workers")
+
+    def test_concurrent_misses_in_one_worker_load_once(self, workers):
+        """Test concurrent misses for one key share a single loader call"""
+        cache = workers[0]
+        loader = CountingLoader({"settings": True})
+
+        async def run():
+            return await asyncio.gather(*(cache.get_or_load("site_settings", (), loader) for _ in range(10)))
+
+        results = asyncio.run(run())
+        assert loader.calls == 1
+        assert all(result == {"settings": True} for result in results)
+        assert cache.stats["site_settings"]["coalesced"] == 9
+        print("✅ 10 concurrent misses in one worker, 1 load")
+
+    def test_concurrent_misses_across_workers_load_once(self, workers):
+        """Test a worker that loses the fill lock waits for the winner's value"""
+        loader = CountingLoader(["lead magnet"])
+
+        async def run():
+            return await asyncio.gather(*(
+                cache.get_or_load("lead_magnets", (), loader) for cache in workers for _ in range(5)
+            ))
+
+        results = asyncio.run(run())
+        assert loader.calls == 1
+        assert all(result == ["lead magnet"] for result in results)
+        print("✅ 10 concurrent misses across 2 workers, 1 load")
@@ -0,0 +1,108 @@
+"""
+Unit Tests for the coalesced counter flush
+Tests: acknowledged deltas leave in_flight before after_flush, partial bulk_write failures retry only the failed updates,
+stop() during a write applies it once
+"""
+import pytest
+import os
+import sys
+import asyncio
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pjc_counter_tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+import server
+from pymongo.errors import BulkWriteError
+
+
+class RecordingCollection:
+    """Collection that applies $inc updates to a dict, failing the listed doc ids once.
+    
+    `ack_delay` holds the acknowledgement back after the write has landed, like a
+    Motor write whose executor thread finishes even if the awaiting task is cancelled.
+    """
+
+    def __init__(self, fail_once=(), ack_delay: float = 0):
+        self.fail_once = set(fail_once)
+        self.ack_delay = ack_delay
+        self.counters = {}
+        self.calls = 0
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls += 1
+        errors = []
+        for index, operation in enumerate(operations):
+            doc_id = operation._filter["id"]
+            if doc_id in self.fail_once:
+                self.fail_once.discard(doc_id)
+                errors.append({"index": index, "code": 2, "errmsg": "simulated failure"})
+                continue
+            for field, amount in operation._doc["$inc"].items():
+                self.counters[(doc_id, field)] = self.counters.get((doc_id, field), 0) + amount
+        await asyncio.sleep(self.ack_delay)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+                                  "nMatched": len(operations) - len(errors), "nModified": len(operations) - len(errors),
+                                  "nRemoved": 0, "upserted": []})
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    fake = RecordingCollection(fail_once={"post-b"})
+    monkeypatch.setattr(server, "db", {"social_media_posts": fake})
+    return fake
+
+
+class TestCounterFlush:
+    """Test CounterCoalescer.flush against partial bulk_write failures"""
+
+    def test_partial_failure_retries_only_failed_updates(self, collection):
+        """Test a retry after BulkWriteError does not re-apply updates that succeeded"""
+        coalescer = server.CounterCoalescer()
+        coalescer.increment("social_media_posts", "post-a", "likes", 2)
+        coalescer.increment("social_media_posts", "post-b", "likes", 3)
+
+        asyncio.run(coalescer.flush())
+        assert collection.counters == {("post-a", "likes"): 2}
+        assert coalescer.in_flight == {("social_media_posts", "post-b", "likes"): 3}
+        assert coalescer.stats["write_errors"] == 1
+
+        asyncio.run(coalescer.flush())
+        assert collection.counters == {("post-a", "likes"): 2, ("post-b", "likes"): 3}
+        assert coalescer.in_flight == {}
+        print("✅ Retry applied only the failed update")
+
+    def test_acknowledged_deltas_cleared_before_after_flush(self, collection):
+        """Test after_flush never sees a written delta still counted as pending"""
+        seen = []
+
+        async def after_flush(collection_names):
+            seen.append(coalescer.pending("social_media_posts", "post-a", "likes"))
+
+        coalescer = server.CounterCoalescer(after_flush=after_flush)
+        coalescer.increment("social_media_posts", "post-a", "likes", 5)
+        coalescer.increment("social_media_posts", "post-b", "likes", 1)
+        asyncio.run(coalescer.flush())
+        assert seen == [0]
+        assert coalescer.pending("social_media_posts", "post-b", "likes") == 1
+        print("✅ Written deltas cleared before cache invalidation")
+
+    def test_stop_during_write_applies_deltas_once(self, monkeypatch):
+        """Test stopping while a flush is mid-write neither loses nor re-applies its deltas"""
+        slow = RecordingCollection(ack_delay=0.2)
+        monkeypatch.setattr(server, "db", {"social_media_posts": slow})
+
+        async def run():
+            coalescer = server.CounterCoalescer(flush_interval_ms=10)
+            coalescer.start()
+            coalescer.increment("social_media_posts", "post-a", "views", 4)
+            await asyncio.sleep(0.05)  # the loop's flush is now waiting on the write
+            await coalescer.stop()
+            return coalescer
+
+        coalescer = asyncio.run(run())
+        assert slow.counters == {("post-a", "views"): 4}
+        assert slow.calls == 1
+        assert coalescer.in_flight == {}
+        print("✅ Shutdown mid-write applied the deltas exactly once")
@@ -0,0 +1,52 @@
+"""
+Unit Tests for sessionizer event ordering
+Tests: events of one beacon share a timestamp and are folded in beacon (seq) order, not by random id
+"""
+import pytest
+import os
+import sys
+import random
+import uuid
+from datetime import datetime, timezone
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pjc_sessionizer_tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+import server
+
+
+def beacon_events(now):
+    """One beacon walking the whole funnel, as /tracking/batch stores it"""
+    steps = [
+        {"kind": "page_view", "page": "/get-quote"},
+        {"kind": "page_view", "page": "/get-quote/thank-you"},
+        {"kind": "event", "event_name": "checkout_started"},
+    ]
+    return [
+        {**step, "id": str(uuid.uuid4()), "session_id": "test-session", "timestamp": now, "seq": seq}
+        for seq, step in enumerate(steps)
+    ]
+
+
+class TestEventOrder:
+    """Test event_order_key against same-millisecond beacons"""
+
+    @pytest.mark.parametrize("shuffle_seed", range(10))
+    def test_beacon_reaches_every_funnel_step(self, shuffle_seed):
+        """Test a beacon's events fold in seq order whatever their uuids"""
+        events = beacon_events(datetime(2025, 1, 1, tzinfo=timezone.utc))
+        random.Random(shuffle_seed).shuffle(events)
+        session = None
+        for event in sorted(events, key=server.event_order_key):
+            session = server.apply_event_to_session(session, event)
+        assert session["funnel_progress"] == len(server.FUNNEL_STEPS) - 1
+        print(f"✅ Seed {shuffle_seed}: reached step {session['funnel_progress']}")
+
+    def test_events_without_seq_sort_first(self):
+        """Test legacy events (no seq) sort before sequenced ones in the same millisecond, as in Mongo"""
+        now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        legacy = {"id": "ffff", "timestamp": now}
+        sequenced = {"id": "0000", "timestamp": now, "seq": 0}
+        assert server.event_order_key(legacy) < server.event_order_key(sequenced)
+        print("✅ Legacy events sort first")
@@ -0,0 +1,55 @@
+"""
+Unit Tests for the write-behind tracking buffers
+Tests: stop() during insert_many neither loses the popped batch nor skips its rollups
+"""
+import pytest
+import os
+import sys
+import asyncio
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "pjc_buffer_tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+import server
+
+
+class SlowCollection:
+    """Collection whose insert_many lands immediately but acknowledges after `ack_delay`"""
+
+    def __init__(self, ack_delay: float = 0.2):
+        self.ack_delay = ack_delay
+        self.docs = []
+
+    async def insert_many(self, docs, ordered=True):
+        self.docs.extend(docs)
+        await asyncio.sleep(self.ack_delay)
+
+
+class TestBufferShutdown:
+    """Test WriteBehindBuffer.stop against an in-progress flush"""
+
+    def test_stop_during_write_keeps_batch_and_rollups(self, monkeypatch):
+        """Test a batch being written when stop() is called is written once and rolled up"""
+        collection = SlowCollection()
+        monkeypatch.setattr(server, "db", {"page_views": collection})
+        rolled_up = []
+
+        async def after_flush(docs):
+            rolled_up.extend(doc["id"] for doc in docs)
+
+        async def run():
+            buffer = server.WriteBehindBuffer("page_views", batch_size=2, flush_interval_ms=10, after_flush=after_flush)
+            buffer.start()
+            for index in range(3):
+                buffer.enqueue({"id": f"view-{index}"})
+            await asyncio.sleep(0.05)  # the loop's flush is now waiting on insert_many
+            await buffer.stop()
+            return buffer
+
+        buffer = asyncio.run(run())
+        ids = [doc["id"] for doc in collection.docs]
+        assert sorted(ids) == ["view-0", "view-1", "view-2"]
+        assert sorted(rolled_up) == ids and len(rolled_up) == 3
+        assert not buffer.queue
+        print("✅ Shutdown mid-write kept the batch and its rollups")